@@ -18,7 +18,7 @@
 #   <http://www.gnu.org/licenses/>.
 #
 
-"""
+r"""
     This module is a simple example of Dragonfly use.
     It shows how to use Dragonfly's Grammar, AppContext, and MappingRule
     classes.  This module can be activated in the same way as other
@@ -26,11 +26,36 @@
     "Program Files\NetLink/MacroSystem".
 """
 
-from dragonfly import (Grammar, AppContext, MappingRule, Dictation,
-                       Key, Text, IntegerRef, Function, Config, Section, Item, RuleRef, Alternative, Repetition,
-                       CompoundRule, Choice)
-
-import lib.format
+import itertools
+import logging
+import os
+import time
+
+from lib.startup import profiler
+
+profiler.start()
+
+with profiler.timing_imports():
+    from dragonfly import (Grammar, AppContext, Dictation,
+                           Key, Text, IntegerRef, Function, Config, Section, Item, RuleRef, Alternative, Repetition,
+                           CompoundRule, Choice, DictListRef)
+
+    import lib.format
+    import lib.planner
+    from lib.executor import executor
+    from lib.grammar_cache import CachedMappingRule
+    from lib.history import commandHistory
+    import lib.identifiers
+    from lib.macros import macroRecorder
+    from lib.pacing import DialogKey
+    from lib.profiling import callProfiler
+    from lib.recognitions import recognitionLog
+    from lib.snippets import Snippet
+    from lib.trace import tracer
+    from lib.vocabulary import recentIdentifiers
+    from lib.watcher import FileWatcher
+
+profiler.mark("imports")
 
 formatMap = {
     "camel case": lib.format.FormatTypes.camelCase,
@@ -57,9 +82,20 @@ formatMap = {
     "environment variable": [lib.format.FormatTypes.snakeCase, lib.format.FormatTypes.upperCase],
 }
 
+mappingNamespace = {
+    "Key": Key,
+    "DialogKey": DialogKey,
+    "Text": Text,
+    "Snippet": Snippet,
+}
+
+# The commands are split into groups, so Dragon only searches the groups
+# that are active, see sequence_rule_groups. Commands from all active groups
+# can be chained in one utterance.
 grammarCfg = Config("Intellij Typescript edit")
-grammarCfg.cmd = Section("Language section")
-grammarCfg.cmd.map = Item(
+
+grammarCfg.navigation = Section("Navigation section")
+grammarCfg.navigation.map = Item(
     {
         # navigation
         # next/prev brace
@@ -72,11 +108,11 @@ grammarCfg.cmd.map = Item(
         "doc end": Key("c-end"),
         "doc start": Key("c-home"),
 
-        "go to column <n>": Key("c-g/25") + Text(":%(n)d") + Key("enter"),
+        "go to column <n>": DialogKey("c-g") + Text(":%(n)d") + Key("enter"),
         "go to declaration": Key("c-b"),
         "go to implemetation": Key("sc-b"),
-        "go to line <n>": Key("c-g/25") + Text("%(n)d") + Key("enter"),
-        "go to line <n> column <m>": Key("c-g/25") + Text("%(n)d:%(m)d") + Key("enter"),
+        "go to line <n>": DialogKey("c-g") + Text("%(n)d") + Key("enter"),
+        "go to line <n> column <m>": DialogKey("c-g") + Text("%(n)d:%(m)d") + Key("enter"),
 
         "left [<n>]": Key("left:%(n)d"),
         "left <n> (word|words)": Key("c-left:%(n)d"),
@@ -125,7 +161,13 @@ grammarCfg.cmd.map = Item(
         "F ten": Key("f10"),
         "F eleven": Key("f11"),
         "F 12": Key("f12"),
+    },
+    namespace=mappingNamespace,
+)
 
+grammarCfg.symbols = Section("Symbols section")
+grammarCfg.symbols.map = Item(
+    {
         # letters
         "(A|alpha)": Text("a"),
         "(B|bravo) ": Text("b"),
@@ -154,6 +196,41 @@ grammarCfg.cmd.map = Item(
         "(Y|yankee) ": Text("y"),
         "(Z|zulu) ": Text("z"),
 
+        # symbols, puncuation etc
+        "bar": Text(" | "),
+        "equal to": Text(" === "),
+        "equals": Text(" = "),
+        "greater than": Text(" > "),
+        "greater than or equal 2": Text(" >= "),
+        "less than": Text(" < "),
+        "less than or equal 2": Text(" <= "),
+        "not equal to": Text(" !== "),
+        "angle bracket": Key("langle"),
+        "close angle bracket": Key("rangle"),
+        "square bracket": Text("["),
+        "close square bracket": Text("]"),
+        "brace": Key("lbrace"),
+        "close brace": Key("rbrace"),
+        "paren": Key("lparen"),
+        "close paren": Key("rparen"),
+        "quote": Key("dquote"),
+        "single quote": Key("squote"),
+        "colon [<n>]": Key("colon:%(n)d"),
+        "semi-colon [<n>]": Key("semicolon:%(n)d"),
+        "comma [<n>]": Key("comma:%(n)d"),
+        "dot [<n>]": Key("dot:%(n)d"),
+        "(dash|hyphen|minus) [<n>]": Key("hyphen:%(n)d"),
+        "underscore [<n>]": Key("underscore:%(n)d"),
+        "plus": Text(" + "),
+        "bang": Text("!"),
+        "at": Text("@"),
+    },
+    namespace=mappingNamespace,
+)
+
+grammarCfg.keywords = Section("Keywords section")
+grammarCfg.keywords.map = Item(
+    {
         # Typescript keywords, defined as commands so case etc is correct
         "abstract": Text("abstract "),
         "as": Text("as "),
@@ -161,31 +238,31 @@ grammarCfg.cmd.map = Item(
         "await": Text("await "),
         "break": Text("break") + Key("enter"),
         "case": Text("case :") + Key("left"),
-        "catch": Text("catch(err) {") + Key("enter"),
-        "class <text>": Text("class ") + Function(lib.format.pascal_case_text) + Text(" {") + Key("enter"),
+        "catch": Snippet("catch (err) {\n    $0\n}"),
+        "class <text>": Snippet("class %(text)s {\n    $0\n}", {"text": lib.format.FormatTypes.pascalCase}),
         "const <text>": Text("const ") + Function(lib.format.camel_case_text),
-        "constructor": Text("constructor () {") + Key("left:3"),
+        "constructor": Snippet("constructor($0) {\n\n}"),
         "continue": Text("continue") + Key("enter"),
         "declare": Text("declare "),
         "default": Text("default "),
         "delete <text>": Text("delete ") + Function(lib.format.camel_case_text),
         "do": Text("do "),
-        "else": Text(" else {") + Key("enter"),
-        "enum <text>": Text("enum ") + Function(lib.format.pascal_case_text) + Text(" {") + Key("enter"),
+        "else": Snippet(" else {\n    $0\n}"),
+        "enum <text>": Snippet("enum %(text)s {\n    $0\n}", {"text": lib.format.FormatTypes.pascalCase}),
         "export": Text("export "),
         "extends <text>": Text("extends ") + Function(lib.format.pascal_case_text),
         "false": Text("false"),
-        "finally": Text("finally {") + Key("enter"),
+        "finally": Snippet("finally {\n    $0\n}"),
         "for of <text>": Text("for (const elem of ") + Function(lib.format.pascal_case_text) + Text("){"),
         "for in <text>": Text("for (const key of ") + Function(lib.format.pascal_case_text) + Text("){"),
-        "function <text>": Text("function ") + Function(lib.format.pascal_case_text) + Text("() {") + Key("enter") + Key("cs-m") + Key("left:2"),
+        "function <text>": Snippet("function %(text)s($0) {\n\n}", {"text": lib.format.FormatTypes.pascalCase}),
         "from": Text("from ''") + Key("left"),
-        "get <text>": Text("get ") + Function(lib.format.camel_case_text) + Text("() {") + Key("enter") + Text("return "),
-        "if": Text("if () {") + Key("enter") + Key("cs-m") + Key("left"),
+        "get <text>": Snippet("get %(text)s() {\n    return $0\n}", {"text": lib.format.FormatTypes.camelCase}),
+        "if": Snippet("if ($0) {\n\n}"),
         "implements <text>": Text("implements ") + Function(lib.format.pascal_case_text),
         "import": Text("import "),
         "in": Text("in "),
-        "interface <text>": Text("interface ") + Function(lib.format.pascal_case_text) + Text(" {") + Key("enter"),
+        "interface <text>": Snippet("interface %(text)s {\n    $0\n}", {"text": lib.format.FormatTypes.pascalCase}),
         "instance of": Text("instanceof "),
         "let <text>": Text("let ") + Function(lib.format.camel_case_text),
         "new": Text("new "),
@@ -196,18 +273,18 @@ grammarCfg.cmd.map = Item(
         "public": Text("public "),
         "read only": Text("readonly "),
         "return": Text("return "),
-        "set <text>": Text("set ") + Function(lib.format.camel_case_text) + Text("() {") + Key("enter") + Key("cs-m") + Key("left:2"),
+        "set <text>": Snippet("set %(text)s($0) {\n\n}", {"text": lib.format.FormatTypes.camelCase}),
         "static": Text("static "),
         "super": Text("super("),
-        "switch": Text("switch () {") + Key("enter") + Text("case :") + Key("enter") + Text("break") + Key("cs-m") + Key("left:2"),
+        "switch": Snippet("switch ($0) {\n    case :\n        break\n}"),
         "this": Text("this"),
         "true": Text("true"),
-        "try": Text("try {") + Key("enter") + Key("down:2") + Text("catch (err) {") + Key("enter") + Key("cs-m") + Key("up"),
+        "try": Snippet("try {\n    $0\n} catch (err) {\n\n}"),
         "type": Text("type "),
         "type of": Text("typeof"),
         "undefined": Text("undefined"),
         "void": Text("void"),
-        "while": Text("while () {") + Key("enter") + Key("cs-m") + Key("left:2"),
+        "while": Snippet("while ($0) {\n\n}"),
 
         # common  methods
         "log": Text("console.log(\""),
@@ -219,36 +296,13 @@ grammarCfg.cmd.map = Item(
         "number": Text("number"),
         "new map": Text("Map<>(") + Key("left:2"),
         "string": Text("string"),
+    },
+    namespace=mappingNamespace,
+)
 
-        # symbols, puncuation etc
-        "bar": Text(" | "),
-        "equal to": Text(" === "),
-        "equals": Text(" = "),
-        "greater than": Text(" > "),
-        "greater than or equal 2": Text(" >= "),
-        "less than": Text(" < "),
-        "less than or equal 2": Text(" <= "),
-        "not equal to": Text(" !== "),
-        "angle bracket": Key("langle"),
-        "close angle bracket": Key("rangle"),
-        "square bracket": Text("["),
-        "close square bracket": Text("]"),
-        "brace": Key("lbrace"),
-        "close brace": Key("rbrace"),
-        "paren": Key("lparen"),
-        "close paren": Key("rparen"),
-        "quote": Key("dquote"),
-        "single quote": Key("squote"),
-        "colon [<n>]": Key("colon:%(n)d"),
-        "semi-colon [<n>]": Key("semicolon:%(n)d"),
-        "comma [<n>]": Key("comma:%(n)d"),
-        "dot [<n>]": Key("dot:%(n)d"),
-        "(dash|hyphen|minus) [<n>]": Key("hyphen:%(n)d"),
-        "underscore [<n>]": Key("underscore:%(n)d"),
-        "plus": Text(" + "),
-        "bang": Text("!"),
-        "at": Text("@"),
-
+grammarCfg.formatting = Section("Formatting section")
+grammarCfg.formatting.map = Item(
+    {
         # Formatting <n> words to the left of the cursor.
         "camel case <n>": Function(lib.format.camel_case_count),
         "camel case <text>": Function(lib.format.camel_case_text),
@@ -262,12 +316,25 @@ grammarCfg.cmd.map = Item(
         "uppercase <text>": Function(lib.format.uppercase_text),
         "lowercase <n>": Function(lib.format.lowercase_count),
         "lowercase <text>": Function(lib.format.lowercase_text),
+        # Replace the identifier left of the cursor with the closest one
+        # declared in the project. Dictated identifiers only get their case
+        # fixed. Ex: "getUsers" + "snap" -> "getUser"
+        "snap [<n>]": Function(lib.format.snap_count),
+        # Type an identifier formatted earlier by saying the same words.
+        # Ex: "recall my new variable" -> "myNewVariable"
+        "recall <identifier>": Text("%(identifier)s"),
         # Format dictated words. See the formatMap for all available types.
         # Ex: "camel case my new variable" -> "myNewVariable"
         # Ex: "snake case my new variable" -> "my_new_variable"
         # Ex: "uppercase squash my new hyphen variable" -> "MYNEW-VARIABLE"
         # "<formatType> <text>": Function(lib.format.format_text),
+    },
+    namespace=mappingNamespace,
+)
 
+grammarCfg.editing = Section("Editing section")
+grammarCfg.editing.map = Item(
+    {
         # editing
         # For writing words that would otherwise be characters or commands.
         # Ex: "period", tab", "left", "right", "home", select word
@@ -280,54 +347,349 @@ grammarCfg.cmd.map = Item(
         "save": Key("c-s"),
         "undo": Key("c-z"),
     },
-    namespace={
-        "Key": Key,
-        "Text": Text,
-    }
+    namespace=mappingNamespace,
 )
-#
-class KeystrokeRule(MappingRule):
+
+# Formatted identifiers are snapped to the closest identifier declared in
+# the project, e.g. "getUserId" to "getUserID". Leave empty to turn it off.
+grammarCfg.identifiers = Section("Identifier section")
+grammarCfg.identifiers.projectRoot = Item("")
+
+# Recognized commands are logged to recognitions/ for replaying with
+# "python -m lib.replay". This includes dictated text.
+grammarCfg.logging = Section("Logging section")
+grammarCfg.logging.recognitions = Item(True)
+profiler.mark("mapping")
+
+
+class KeystrokeRule(CachedMappingRule):
     exported = False
-    mapping = grammarCfg.cmd.map
+    group = None  # The command group of the mapping, for the recognition log.
     extras = [
         IntegerRef("n", 1, 1000),
         IntegerRef("m", 1, 1000),
         Dictation("text"),
         Dictation("text2"),
+        DictListRef("identifier", recentIdentifiers.list),
     ]
     defaults = {
         "n": 1,
     }
 
-alternatives = []
-alternatives.append(RuleRef(rule=KeystrokeRule()))
-single_action = Alternative(alternatives)
-
-sequence = Repetition(single_action, min=1, max=8, name="sequence")
-
 
 class RepeatRule(CompoundRule):
     # Here we define this rule's spoken-form and special elements.
     spec = "<sequence> [[[and] repeat [that]] <n> times]"
-    extras = [
-        sequence,  # Sequence of actions defined above.
-        IntegerRef("n", 1, 1000),  # Times to repeat the sequence.
-    ]
     defaults = {
         "n": 1,  # Default repeat count.
     }
 
+    def __init__(self, name, keystrokeRules, context=None):
+        self.keystrokeRules = keystrokeRules
+        self.ruleContext = context  # CompoundRule.context is the class default, not this.
+        single_action = Alternative([RuleRef(rule=keystrokeRule) for keystrokeRule in keystrokeRules])
+        sequence = Repetition(single_action, min=1, max=8, name="sequence")
+        CompoundRule.__init__(self, name=name, context=context, extras=[
+            sequence,  # Sequence of actions from the groups' keystroke rules.
+            IntegerRef("n", 1, 1000),  # Times to repeat the sequence.
+        ])
+
     def _process_recognition(self, node, extras):  # @UnusedVariable
-        sequence = extras["sequence"]  # A sequence of actions.
-        count = extras["n"]  # An integer repeat count.
-        for i in range(count):  # @UnusedVariable
-            for action in sequence:
-                action.execute()
-
-grammar = Grammar("IntelliJ Typescript edit", context=AppContext(executable="idea64"))
-grammar.add_rule(RepeatRule())  # Add the top-level rule.
+        started = time.time()
+        with callProfiler.section():
+            sequence = extras["sequence"]  # A sequence of actions.
+            count = extras["n"]  # An integer repeat count.
+            # Fold the repeats into as few key and text events as possible,
+            # and run them in the background so Dragon isn't blocked.
+            with tracer.span("plan", rule=self.name, count=count):
+                plan = lib.planner.plan_repetition(sequence, count)
+            macroRecorder.record(plan)
+            executor.submit(plan, started)
+            recognitionLog.record(sequence, count, node.words(), started)
+
+
+class StopRule(CompoundRule):
+    # Cancels any sequences that are still queued or running.
+    spec = "stop"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        executor.cancel()
+
+
+class UndoRule(CompoundRule):
+    # Reverses everything the last command did in one batch of keys.
+    spec = "(undo|scratch) that"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        # Queued behind the commands still running, so it undoes the last.
+        plan = [(lib.planner.StepTypes.action, (Function(commandHistory.undo), {}))]
+        executor.submit(plan, time.time(), record=False)
+
+
+class RepeatLastRule(CompoundRule):
+    # Runs the plan of the last command again, n times as one plan.
+    spec = "repeat last command [<n>]"
+    extras = [IntegerRef("n", 1, 1000)]
+    defaults = {"n": 1}
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        entry = commandHistory.last()
+        if entry is not None:
+            executor.submit(lib.planner.compile_plan(entry.plan, extras["n"]), time.time())
+
+
+class StartProfilingRule(CompoundRule):
+    # Profiles recognitions and executed commands until "stop profiling".
+    spec = "start profiling"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        callProfiler.start()
+
+
+class StopProfilingRule(CompoundRule):
+    # Writes the session's profile and hot function summary to profiles/.
+    spec = "stop profiling"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        callProfiler.stop()
+
+
+class RecordMacroRule(CompoundRule):
+    # Starts recording the commands that follow as a macro.
+    spec = "record macro"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        macroRecorder.start()
+
+
+class StopRecordingRule(CompoundRule):
+    # Compiles the recorded commands into a macro and saves it.
+    spec = "stop recording"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        steps = macroRecorder.stop()
+        logging.getLogger("grammer.macros").info("Recorded a macro of %d steps", steps)
+
+
+class PlayMacroRule(CompoundRule):
+    # Plays the recorded macro, e.g. "play macro 20 times" as one plan.
+    spec = "play macro [<n> times]"
+    extras = [IntegerRef("n", 1, 1000)]
+    defaults = {"n": 1}
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        plan = macroRecorder.plan(count=extras["n"])
+        if plan is not None:
+            executor.submit(plan, time.time())
+
+
+ideaContext = AppContext(executable="idea64")
+typescriptContext = (AppContext(executable="idea64", title=".ts")
+                     | AppContext(executable="idea64", title=".js"))
+
+# Group name -> (mapping, context the group is active in).
+commandGroups = {
+    "navigation": (grammarCfg.navigation.map, ideaContext),
+    "symbols": (grammarCfg.symbols.map, ideaContext),
+    "keywords": (grammarCfg.keywords.map, typescriptContext),
+    "formatting": (grammarCfg.formatting.map, ideaContext),
+    "editing": (grammarCfg.editing.map, ideaContext),
+}
+
+# Group name -> whether its commands are switched on, see ModeRule.
+enabledGroups = dict((group, True) for group in commandGroups)
+
+# Commands can be added or overridden in the config file next to this
+# module, e.g. navigation.map["page top"] = Key("c-pgup"). The file is
+# watched while the grammar is loaded, and the rules of the groups whose
+# commands changed are replaced.
+configPath = os.path.splitext(os.path.abspath(__file__))[0] + ".txt"
+defaultMappings = dict((group, dict(mapping)) for group, (mapping, context) in commandGroups.items())
+loadedMappings = {}
+
+
+def load_config():
+    """Loads the config file over the default commands and returns the
+    groups whose commands changed since the last load.
+
+    """
+    for group, (mapping, context) in commandGroups.items():
+        mapping.clear()  # The file may have changed the defaults in place.
+        mapping.update(defaultMappings[group])
+    grammarCfg.load(configPath)
+    recognitionLog.enabled = grammarCfg.logging.recognitions
+    changed = []
+    for group, (mapping, context) in list(commandGroups.items()):
+        mapping = getattr(grammarCfg, group).map
+        commandGroups[group] = (mapping, context)
+        if not _same_mapping(mapping, loadedMappings.get(group)):
+            changed.append(group)
+        loadedMappings[group] = dict(mapping)
+    return changed
+
+
+def _same_mapping(mapping, other):
+    if other is None or set(mapping) != set(other):
+        return False
+    for spec, action in mapping.items():
+        otherAction = other[spec]
+        if action is not otherAction and (type(action), str(action)) != (type(otherAction), str(otherAction)):
+            return False
+    return True
+
+
+def reload_config():
+    """Replaces the rules of the command groups the config file changed."""
+    projectRoot = grammarCfg.identifiers.projectRoot
+    changed = load_config()
+    if changed:
+        update_command_grammar(changed)
+        logging.getLogger("grammer.config").info("Reloaded the %s commands", ", ".join(sorted(changed)))
+    if grammarCfg.identifiers.projectRoot != projectRoot:
+        if grammarCfg.identifiers.projectRoot:
+            lib.identifiers.open_index(grammarCfg.identifiers.projectRoot)
+        else:
+            lib.identifiers.close_index()
+
+
+def sequence_rule_groups():
+    """Returns the sequence rules the enabled groups need, as rule name ->
+    (groups, context).
+
+    Commands from all enabled groups can be chained in one utterance, but
+    Dragon only searches the groups active in the foreground window: there
+    is one sequence rule per combination of the group contexts, and
+    dragonfly activates the one matching the window at the start of every
+    utterance.
+
+    """
+    contexts = []
+    for group in sorted(commandGroups):
+        context = commandGroups[group][1]
+        if enabledGroups[group] and context not in contexts:
+            contexts.append(context)
+    results = {}
+    for matches in itertools.product((True, False), repeat=len(contexts)):
+        groups = tuple(group for group in sorted(commandGroups)
+                       if enabledGroups[group] and matches[contexts.index(commandGroups[group][1])])
+        if not groups:
+            continue
+        ruleContext = None
+        for context, match in zip(contexts, matches):
+            term = context if match else ~context
+            ruleContext = term if ruleContext is None else ruleContext & term
+        results["%s repeat" % " ".join(groups)] = (groups, ruleContext)
+    return results
+
+
+def update_command_grammar(changed=()):
+    """Brings the command grammar in line with the groups' mappings and
+    enabled states, replacing only the rules that changed.
+
+    The keystroke rules of the changed groups are built again, and only the
+    sequence rules that refer to them, or to a group switched on or off, are
+    replaced. A switched off group's keystroke rule is kept for when it is
+    switched on again. Dragonfly can't change the rules of a loaded
+    grammar, so the grammar is reloaded when any rule is replaced, but the
+    other rules and their parsed specs are kept.
+
+    """
+    for group in changed:
+        keystrokeRules.pop(group, None)
+    for group in commandGroups:
+        if enabledGroups[group] and group not in keystrokeRules:
+            keystrokeRules[group] = KeystrokeRule(name="%s keystrokes" % group, mapping=commandGroups[group][0])
+            keystrokeRules[group].group = group
+    wanted = sequence_rule_groups()
+    stale = []
+    for rule in commandGrammar.rules:
+        if isinstance(rule, RepeatRule):
+            groups, context = wanted.get(rule.name, ((), None))
+            current = (rule.keystrokeRules == [keystrokeRules[group] for group in groups]
+                       and str(rule.ruleContext) == str(context))  # Switching a group off can change it.
+        elif isinstance(rule, KeystrokeRule):
+            current = enabledGroups[rule.group] and keystrokeRules.get(rule.group) is rule
+        else:
+            continue  # A dependency dragonfly added for an extra, added again on load if still used.
+        if not current:
+            stale.append(rule)
+    names = set(rule.name for rule in commandGrammar.rules if rule not in stale)
+    added = [RepeatRule(name, [keystrokeRules[group] for group in groups], context=context)
+             for name, (groups, context) in sorted(wanted.items()) if name not in names]
+    if not stale and not added:
+        return
+    commandGrammar.unload()
+    for rule in commandGrammar.rules:
+        if rule in stale or not isinstance(rule, (KeystrokeRule, RepeatRule)):
+            commandGrammar.remove_rule(rule)
+    for rule in added:
+        commandGrammar.add_rule(rule)
+    if commandGrammar.rules:
+        commandGrammar.load()
+
+
+class TraceRule(CompoundRule):
+    # Writes the recent latency spans as a Chrome trace and logs a summary.
+    spec = "export trace"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        tracer.export_chrome_trace()
+        for line in tracer.summary():
+            logging.getLogger("grammer.trace").info(line)
+
+
+class RefreshIdentifiersRule(CompoundRule):
+    # Rescans the project files changed since the identifier index was built.
+    spec = "refresh identifiers"
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        lib.identifiers.refresh()
+
+
+class ModeRule(CompoundRule):
+    # Switches command groups on and off, e.g. "keywords mode off" or
+    # "all modes on", by replacing the sequence rules of the command grammar.
+    spec = "<group> (mode|modes) <enabled>"
+    extras = [
+        Choice("group", dict([(group, [group]) for group in commandGroups] + [("all", list(commandGroups))])),
+        Choice("enabled", {"on": True, "off": False}),
+    ]
+
+    def _process_recognition(self, node, extras):  # @UnusedVariable
+        for group in extras["group"]:
+            enabledGroups[group] = extras["enabled"]
+        update_command_grammar()
+
+profiler.mark("rules")
+
+grammar = Grammar("IntelliJ Typescript edit", context=ideaContext)
+grammar.add_rule(StopRule())
+grammar.add_rule(ModeRule())
+grammar.add_rule(TraceRule())
+grammar.add_rule(UndoRule())
+grammar.add_rule(StartProfilingRule())
+grammar.add_rule(StopProfilingRule())
+grammar.add_rule(RepeatLastRule())
+grammar.add_rule(RecordMacroRule())
+grammar.add_rule(StopRecordingRule())
+grammar.add_rule(PlayMacroRule())
+grammar.add_rule(RefreshIdentifiersRule())
 grammar.load()  # Load the grammar.
 
+load_config()
+commandGrammar = Grammar("IntelliJ Typescript edit - commands")
+keystrokeRules = {}  # Group name -> KeystrokeRule, kept while its commands don't change.
+update_command_grammar()
+
+if grammarCfg.identifiers.projectRoot:
+    lib.identifiers.open_index(grammarCfg.identifiers.projectRoot)
+
+configWatcher = FileWatcher(configPath, reload_config)
+configWatcher.start()
+
+profiler.mark("load")
+profiler.stop()
+
 
 # ---------------------------------------------------------------------------
 # Create this module's grammar and the context under which it'll be active.
@@ -389,5 +751,11 @@ grammar.load()  # Load the grammar.
 # Unload function which will be called by natlink at unload time.
 def unload():
     global grammar
+    executor.cancel()
+    configWatcher.stop()
+    lib.identifiers.close_index()
+    recognitionLog.close()
+    if commandGrammar is not None:
+        commandGrammar.unload()
     if grammar: grammar.unload()
     grammar = None
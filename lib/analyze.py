@@ -0,0 +1,343 @@
+"""Offline complexity report for the grammars built by _app_intellij.py.
+
+Run from the grammar directory with "python -m lib.analyze". Dragonfly's
+text engine stands in for Dragon, so this works without Natlink.
+
+"""
+import argparse
+import math
+import sys
+from collections import defaultdict
+
+from dragonfly import Alternative, Dictation, ListRef, Literal, Optional, RuleRef, Sequence, get_engine
+
+# Expansions of a single spec are capped, to keep a pathological spec from
+# stalling the report.
+MAX_EXPANSIONS = 1000
+
+
+def load_groups():
+    """Imports the grammar module against the text engine and returns a
+    KeystrokeRule for every command group.
+
+    """
+    get_engine("text")
+    import _app_intellij
+    return dict((group, _app_intellij.KeystrokeRule(name="%s keystrokes" % group, mapping=mapping))
+                for group, (mapping, context) in _app_intellij.commandGroups.items())
+
+
+def count_elements(element, counts=None, seen=None):
+    """Counts the elements in a tree by type, following rule references
+    once.
+
+    """
+    if counts is None:
+        counts = defaultdict(int)
+        seen = set()
+    counts[type(element).__name__] += 1
+    children = list(element.children)
+    if isinstance(element, RuleRef) and id(element.rule) not in seen:
+        seen.add(id(element.rule))
+        children.append(element.rule.element)
+    for child in children:
+        count_elements(child, counts, seen)
+    return counts
+
+
+def integer_range(element):
+    """Returns how many values an integer extra can take, or None."""
+    rule = getattr(element, "rule", None)
+    integer = getattr(rule, "element", None)
+    if getattr(integer, "_min", None) is None:
+        return None
+    return integer._max - integer._min
+
+
+def count_states(element, seen=None):
+    """Estimates the number of states a recognizer needs for an element:
+    one per word or extra reference, plus the values of every integer extra
+    once, since its rule is shared.
+
+    """
+    if seen is None:
+        seen = set()
+    if isinstance(element, Literal):
+        return len(element.words)
+    if isinstance(element, (Dictation, ListRef)):
+        return 1
+    size = integer_range(element)
+    if size is not None:
+        if id(element) in seen:
+            return 1
+        seen.add(id(element))
+        return 1 + size
+    return sum(count_states(child, seen) for child in element.children)
+
+
+def count_phrases(element):
+    """Returns how many distinct phrases an element accepts, counting each
+    dictation as one.
+
+    """
+    if isinstance(element, Literal) or isinstance(element, Dictation):
+        return 1
+    size = integer_range(element)
+    if size is not None:
+        return size
+    if isinstance(element, Optional):
+        return 1 + count_phrases(element.children[0])
+    if isinstance(element, Sequence):
+        result = 1
+        for child in element.children:
+            result *= count_phrases(child)
+        return result
+    if isinstance(element, Alternative):
+        return sum(count_phrases(child) for child in element.children)
+    return 1
+
+
+def expand(element):
+    """Returns every word sequence an element accepts, with extras kept as
+    "<name>" placeholders, or "<name...>" for dictation which can stand for
+    any number of words.
+
+    """
+    if isinstance(element, Literal):
+        return [tuple(word.lower() for word in element.words)]
+    if element.name and isinstance(element, Dictation):
+        return [("<%s...>" % element.name,)]
+    if element.name and (integer_range(element) is not None or isinstance(element, ListRef)):
+        return [("<%s>" % element.name,)]
+    if isinstance(element, Optional):
+        return [()] + expand(element.children[0])
+    if isinstance(element, Sequence):
+        results = [()]
+        for child in element.children:
+            results = [head + tail for head in results for tail in expand(child)][:MAX_EXPANSIONS]
+        return results
+    if isinstance(element, Alternative):
+        results = []
+        for child in element.children:
+            results.extend(expand(child))
+        return results[:MAX_EXPANSIONS]
+    return [("<%s>" % type(element).__name__,)]
+
+
+def spec_expansions(rule):
+    """Returns {spec: set of word sequences} for a mapping rule."""
+    return dict((compound._spec, set(expand(compound))) for compound in rule.element.children)
+
+
+def find_conflicts(expansions):
+    """Returns (phrase, specs) for every phrase accepted by more than one
+    spec.
+
+    """
+    owners = defaultdict(set)
+    for spec, phrases in expansions.items():
+        for phrase in phrases:
+            owners[phrase].add(spec)
+    return sorted((" ".join(phrase), sorted(specs)) for phrase, specs in owners.items() if len(specs) > 1)
+
+
+def _matches(pattern, phrase):
+    if not pattern:
+        return not phrase
+    if pattern[0].endswith("...>"):
+        return any(_matches(pattern[1:], phrase[end:]) for end in range(1, len(phrase) + 1))
+    return bool(phrase) and pattern[0] == phrase[0] and _matches(pattern[1:], phrase[1:])
+
+
+def find_dictation_overlaps(expansions):
+    """Returns (spec, otherSpec) where a dictation extra in spec can also
+    swallow the words of otherSpec, e.g. "camel case <text>" against
+    "camel case <n>".
+
+    """
+    overlaps = set()
+    for spec, phrases in expansions.items():
+        patterns = [phrase for phrase in phrases if any(word.endswith("...>") for word in phrase)]
+        for otherSpec, otherPhrases in expansions.items():
+            if otherSpec != spec and any(_matches(pattern, phrase) for pattern in patterns for phrase in otherPhrases):
+                overlaps.add((spec, otherSpec))
+    return sorted(overlaps)
+
+
+def find_dead_specs(expansions):
+    """Returns the specs whose every phrase is also accepted by another
+    spec, so Dragon may never pick them.
+
+    """
+    dead = []
+    for spec, phrases in expansions.items():
+        others = set()
+        for otherSpec, otherPhrases in expansions.items():
+            if otherSpec != spec:
+                others |= otherPhrases
+        if phrases and phrases <= others:
+            dead.append(spec)
+    return sorted(dead)
+
+
+def find_prefix_overlaps(expansions):
+    """Returns (spec, longerSpec) where a phrase of spec is a proper prefix
+    of a phrase of longerSpec, so the recognizer can only tell them apart
+    from the words that follow, e.g. "left [<n>]" against
+    "left <n> (word|words)".
+
+    """
+    overlaps = set()
+    for spec, phrases in expansions.items():
+        for longerSpec, longerPhrases in expansions.items():
+            if longerSpec != spec and any(len(longer) > len(phrase) and longer[:len(phrase)] == phrase
+                                          for phrase in phrases for longer in longerPhrases):
+                overlaps.add((spec, longerSpec))
+    return sorted(overlaps)
+
+
+def find_sequence_overlaps(expansions):
+    """Returns (spec, longerSpec, remainder) where a phrase of spec is a
+    proper prefix of a phrase of longerSpec and the rest of it can be said
+    as commands on its own. Inside a repeated sequence such an utterance
+    has two parses, e.g. "up word" against "up" followed by "word".
+
+    """
+    allPhrases = set()
+    for phrases in expansions.values():
+        allPhrases |= phrases
+
+    def is_sequence(words):
+        if not words:
+            return True
+        return any(words[:end] in allPhrases and is_sequence(words[end:]) for end in range(len(words), 0, -1))
+
+    overlaps = set()
+    for spec, phrases in expansions.items():
+        for longerSpec, longerPhrases in expansions.items():
+            if longerSpec == spec:
+                continue
+            for phrase in phrases:
+                for longer in longerPhrases:
+                    if len(longer) > len(phrase) and longer[:len(phrase)] == phrase and is_sequence(longer[len(phrase):]):
+                        overlaps.add((spec, longerSpec, " ".join(longer[len(phrase):])))
+    return sorted(overlaps)
+
+
+def find_duplicate_actions(rule):
+    """Returns the groups of specs that map to the same action."""
+    specsByAction = defaultdict(list)
+    for spec, action in rule._mapping.items():
+        specsByAction[repr(action)].append(spec)
+    return sorted(sorted(specs) for specs in specsByAction.values() if len(specs) > 1)
+
+
+def combined_expansions(groups):
+    """Returns {"group: spec": set of word sequences} over all groups, as
+    RepeatRule alternates between the enabled groups in one sequence.
+
+    """
+    expansions = {}
+    for group, rule in groups.items():
+        for spec, phrases in spec_expansions(rule).items():
+            expansions["%s: %s" % (group, spec)] = phrases
+    return expansions
+
+
+def crosses_groups(*keys):
+    """Returns whether combined_expansions keys come from different groups."""
+    return len(set(key.split(": ", 1)[0] for key in keys)) > 1
+
+
+def repetition_scaling(rules, maxRepeats):
+    """Returns (max, states, log10 phrases) for a Repetition of the
+    alternatives of rules, as used by RepeatRule. The compiled grammar grows
+    linearly with max, the number of phrases Dragon has to choose from grows
+    exponentially.
+
+    """
+    seen = set()  # The integer extras are shared between the rules.
+    states = sum(count_states(rule.element, seen) for rule in rules)
+    phrases = sum(count_phrases(rule.element) for rule in rules)
+    rows = []
+    for repeats in maxRepeats:
+        total = sum(phrases ** count for count in range(1, repeats + 1))
+        rows.append((repeats, states + repeats, math.log10(total)))
+    return rows
+
+
+def report(groups, maxRepeats=(1, 2, 4, 8, 16), out=sys.stdout):
+    totalStates = 0
+    for group in sorted(groups):
+        rule = groups[group]
+        counts = count_elements(rule.element)
+        states = count_states(rule.element)
+        totalStates += states
+        expansions = spec_expansions(rule)
+        out.write("== %s: %d specs, %d elements, ~%d states, %d phrases\n"
+                  % (group, len(rule._mapping), sum(counts.values()), states, count_phrases(rule.element)))
+        out.write("   elements: %s\n" % ", ".join("%s %d" % item for item in sorted(counts.items())))
+        for phrase, specs in find_conflicts(expansions):
+            out.write("   conflict: %r accepted by %s\n" % (phrase, ", ".join(repr(spec) for spec in specs)))
+        for spec in find_dead_specs(expansions):
+            out.write("   dead: %r is fully covered by other specs\n" % spec)
+        for spec, otherSpec in find_dictation_overlaps(expansions):
+            out.write("   dictation overlap: %r also accepts %r\n" % (spec, otherSpec))
+        for spec, longerSpec in find_prefix_overlaps(expansions):
+            out.write("   prefix overlap: %r is a prefix of %r\n" % (spec, longerSpec))
+        for spec, longerSpec, remainder in find_sequence_overlaps(expansions):
+            out.write("   sequence overlap: %r + %r reads as %r\n" % (spec, remainder, longerSpec))
+        for specs in find_duplicate_actions(rule):
+            out.write("   same action: %s\n" % ", ".join(repr(spec) for spec in specs))
+        out.write("   repetition max  states  log10(phrases)\n")
+        for repeats, repeatStates, logPhrases in repetition_scaling([rule], maxRepeats):
+            out.write("   %14d %7d %15.1f\n" % (repeats, repeatStates, logPhrases))
+    out.write("== total: ~%d states over %d groups\n" % (totalStates, len(groups)))
+    report_combined(groups, maxRepeats, out)
+
+
+def report_combined(groups, maxRepeats=(1, 2, 4, 8, 16), out=sys.stdout):
+    """Reports the sequence rule of all groups together, as Dragon sees it
+    in a window where every group is active: the overlaps between specs of
+    different groups, which the per group sections can't show, and how the
+    combined rule grows with the repetition maximum.
+
+    """
+    rules = [groups[group] for group in sorted(groups)]
+    seen = set()
+    states = sum(count_states(rule.element, seen) for rule in rules)
+    expansions = combined_expansions(groups)
+    out.write("== combined: %d specs, ~%d states, %d phrases\n"
+              % (len(expansions), states, sum(count_phrases(rule.element) for rule in rules)))
+    for phrase, specs in find_conflicts(expansions):
+        if crosses_groups(*specs):
+            out.write("   conflict: %r accepted by %s\n" % (phrase, ", ".join(repr(spec) for spec in specs)))
+    deadInGroups = set("%s: %s" % (group, spec) for group in groups
+                       for spec in find_dead_specs(spec_expansions(groups[group])))
+    for spec in find_dead_specs(expansions):
+        if spec not in deadInGroups:  # Those are in the group's own section.
+            out.write("   dead: %r is fully covered by other specs\n" % spec)
+    for spec, otherSpec in find_dictation_overlaps(expansions):
+        if crosses_groups(spec, otherSpec):
+            out.write("   dictation overlap: %r also accepts %r\n" % (spec, otherSpec))
+    for spec, longerSpec in find_prefix_overlaps(expansions):
+        if crosses_groups(spec, longerSpec):
+            out.write("   prefix overlap: %r is a prefix of %r\n" % (spec, longerSpec))
+    for spec, longerSpec, remainder in find_sequence_overlaps(expansions):
+        if crosses_groups(spec, longerSpec):
+            out.write("   sequence overlap: %r + %r reads as %r\n" % (spec, remainder, longerSpec))
+    out.write("   repetition max  states  log10(phrases)\n")
+    for repeats, repeatStates, logPhrases in repetition_scaling(rules, maxRepeats):
+        out.write("   %14d %7d %15.1f\n" % (repeats, repeatStates, logPhrases))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-repeat", type=int, action="append",
+                        help="repetition maximum to show the scaling for, may be given more than once")
+    args = parser.parse_args(argv)
+    report(load_groups(), args.max_repeat or (1, 2, 4, 8, 16))
+
+
+if __name__ == "__main__":
+    main()
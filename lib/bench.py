@@ -0,0 +1,149 @@
+"""Headless benchmark of the grammar commands and format chains.
+
+Run from the grammar directory with "python -m lib.bench". Every spec of
+every command group is mimicked through dragonfly's text engine, and every
+formatMap chain is run over sample dictations, with the output going to a
+StandInBackend. Per command it reports the latency, the number of emitted
+events, the simulated playback time and the memory allocated.
+
+"""
+import argparse
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from dragonfly import get_engine
+
+from lib.analyze import expand
+from lib.standin import StandInBackend, wait_for_actions
+
+# Words mimicked for the extras of a spec.
+EXTRA_WORDS = {
+    "<n>": "three",
+    "<m>": "two",
+    "<identifier>": "my new variable",
+}
+DICTATION_WORDS = "my new variable"
+SAMPLE_DICTATIONS = [
+    "my new variable",
+    "get user by id",
+    "A\\letter B\\letter C\\letter",
+    "max .\\dot value ,\\comma min .\\dot value",
+    "the quick brown fox jumps over the lazy dog and keeps on running",
+]
+DOCUMENT = "let result = first second third fourth fifth"
+CONTEXT = {"executable": "idea64", "title": "project - app.ts"}
+
+
+class Measurement(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.totalTime = 0.0
+        self.events = 0
+        self.simulatedTime = 0.0
+        self.allocated = 0
+
+    @property
+    def meanTime(self):
+        return self.totalTime / self.runs if self.runs else 0.0
+
+
+def spec_words(compound):
+    """Returns the words to mimic for a spec, or None if it can't be said."""
+    phrases = sorted(expand(compound), key=len)
+    if not phrases:
+        return None
+    words = []
+    for word in phrases[-1]:
+        if word.endswith("...>"):
+            words.extend(DICTATION_WORDS.split())
+        else:
+            words.extend(EXTRA_WORDS.get(word, word).split())
+    return words
+
+
+def measure(name, backend, run, repeats):
+    measurement = Measurement(name)
+    for i in range(repeats):  # @UnusedVariable
+        backend.reset(DOCUMENT)
+        if tracemalloc:
+            tracemalloc.start()
+        start = time.time()
+        run()
+        measurement.totalTime += time.time() - start
+        if tracemalloc:
+            measurement.allocated += tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        measurement.runs += 1
+        measurement.events += len(backend.events)
+        measurement.simulatedTime += backend.simulatedTime
+    return measurement
+
+
+def bench_commands(backend, repeats):
+    engine = get_engine("text")
+    import _app_intellij
+    _app_intellij.recentIdentifiers.remember(EXTRA_WORDS["<identifier>"].split(), "myNewVariable")
+    _app_intellij.recentIdentifiers.flush()
+    measurements = []
+    for group in sorted(_app_intellij.commandGroups):
+        keystrokeRule = _app_intellij.KeystrokeRule(name="%s bench" % group, mapping=_app_intellij.commandGroups[group][0])
+        for compound in keystrokeRule.element.children:
+            words = spec_words(compound)
+            if words is None:
+                continue
+
+            def run(words=words):
+                engine.mimic(words, **CONTEXT)
+                wait_for_actions()
+
+            try:
+                measurements.append(measure("%s: %s" % (group, compound._spec), backend, run, repeats))
+            except Exception as e:
+                sys.stderr.write("Failed to mimic %r: %s\n" % (" ".join(words), e))
+    return measurements
+
+
+def bench_formats(backend, repeats):
+    import _app_intellij
+    import lib.format
+    measurements = []
+    for name, formatType in sorted(_app_intellij.formatMap.items()):
+
+        def run(formatType=formatType):
+            lib.format.formatCache.clear()
+            for dictation in SAMPLE_DICTATIONS:
+                lib.format.format_text(dictation, formatType)
+
+        measurements.append(measure("format: %s" % name, backend, run, repeats))
+    return measurements
+
+
+def report(measurements, out=sys.stdout):
+    out.write("%-55s %9s %7s %10s %9s\n" % ("command", "latency", "events", "simulated", "alloc"))
+    for m in measurements:
+        out.write("%-55s %7.2fms %7.1f %8.2fms %7.1fKB\n" % (
+            m.name[:55], m.meanTime * 1000, float(m.events) / m.runs,
+            m.simulatedTime / m.runs * 1000, m.allocated / 1024.0 / m.runs))
+    total = sum(m.meanTime for m in measurements)
+    out.write("%d commands, %.1fms total mean latency\n" % (len(measurements), total * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="runs per command")
+    args = parser.parse_args(argv)
+    get_engine("text")
+    with StandInBackend() as backend:
+        measurements = bench_commands(backend, args.repeats) + bench_formats(backend, args.repeats)
+    report(measurements)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from dragonfly import Clipboard, Key
+
+from lib import pacing
+from lib.trace import tracer
+
+_log = logging.getLogger("grammer.clipboard")
+
+# Longest wait for an earlier transaction's restore before a snapshot, a
+# second more than the restore delay after a cut that wasn't seen, with its
+# delays backed off all the way.
+RESTORE_TIMEOUT = 1.0 + (pacing.TIMEOUT_FACTOR + 1) * pacing.MAX_DELAY / 100.0
+
+# The restore thread of the last transaction that changed the clip board.
+_pendingRestore = None
+_pendingLock = threading.Lock()
+
+
+class ClipboardTransaction(object):
+    """Owns the system clip board for the length of one command.
+
+    The previous clip board text is only read the first time the transaction
+    changes the clip board. When the transaction ends, that text is put back
+    on a background thread, so the recognition callback returns without
+    waiting for the restore. The next transaction waits for that restore
+    before it takes its own snapshot, so it never saves the text of the
+    previous command as the user's. The time taken by each phase is kept in
+    timings and logged once the restore has finished.
+
+    Example:
+    with ClipboardTransaction() as transaction:
+        cutText = transaction.cut_words(3)
+        Text(cutText.upper()).execute()
+
+    """
+
+    def __init__(self, restoreDelay=0.0):
+        self.clipboard = Clipboard()
+        self.restoreDelay = restoreDelay
+        self.timings = OrderedDict()
+        self.cutText = ""
+        self._savedText = None
+        self._snapshotTaken = False
+        self._started = None
+        self._restoreThread = None
+
+    def __enter__(self):
+        self._started = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        global _pendingRestore
+        self._record("body", self._started)
+        if self._snapshotTaken:
+            self._restoreThread = threading.Thread(target=self._restore, name="clipboard-restore")
+            self._restoreThread.daemon = True
+            with _pendingLock:
+                _pendingRestore = self._restoreThread
+            self._restoreThread.start()
+        else:
+            self._report()
+        return False
+
+    def snapshot(self):
+        """Saves the current clip board text, if not already saved."""
+        if not self._snapshotTaken:
+            start = time.time()
+            wait_for_restore(RESTORE_TIMEOUT)
+            self._savedText = self.clipboard.get_system_text()
+            self._snapshotTaken = True
+            self._record("snapshot", start)
+
+    def cut_words(self, wordCount):
+        """Selects wordCount number of words to the left of the cursor and cuts
+        them out of the text. Returns the text from the system clip board.
+
+        """
+        self.snapshot()
+        start = time.time()
+        self.clipboard.set_system_text('')
+        Key('cs-left/%s:%s, c-x' % (pacing.profile.delay("select"), wordCount)).execute()
+        text = pacing.wait_until("cut", self.clipboard.get_system_text)
+        self._record("cut", start)
+        self.cutText = (text or "") + self.cutText
+        return text
+
+    def restore_cut(self):
+        """Pastes back the words of a cut whose text never showed up. The
+        editor handles the keys in order, so if the cut lands late after
+        all, the paste still gets its text, as long as the clip board isn't
+        restored before then.
+
+        """
+        Key("c-v").execute()
+        self.restoreDelay = max(self.restoreDelay,
+                                pacing.profile.timeout("cut") + pacing.profile.delay("paste") / 100.0)
+
+    def take_cut_text(self):
+        """Returns the text cut so far and forgets it, so it is only
+        reported as replaced by the next insertion.
+
+        """
+        text, self.cutText = self.cutText, ""
+        return text
+
+    def paste(self, text):
+        """Pastes text through the clip board. Returns False if the clip board
+        couldn't be set.
+
+        """
+        self.snapshot()
+        start = time.time()
+        self.clipboard.set_system_text(text)
+        if self.clipboard.get_system_text() != text:
+            return False
+        pasted = Key("c-v").execute()
+        # Give the editor time to read the clip board before it is restored.
+        self.restoreDelay = max(self.restoreDelay, pacing.profile.delay("paste") / 100.0)
+        self._record("paste", start)
+        return pasted is not False
+
+    def wait(self, timeout=None):
+        """Blocks until the previous clip board text has been restored."""
+        if self._restoreThread:
+            self._restoreThread.join(timeout)
+
+    def _restore(self):
+        if self.restoreDelay:
+            time.sleep(self.restoreDelay)
+        start = time.time()
+        try:
+            self.clipboard.set_text(self._savedText)  # Restore previous clipboard text.
+            self.clipboard.copy_to_system()
+        except Exception:
+            _log.exception("Failed to restore clipboard text")
+        self._record("restore", start)
+        self._report()
+
+    def _record(self, phase, start):
+        self.timings[phase] = time.time() - start
+        tracer.record("clipboard %s" % phase, start, self.timings[phase])
+
+    def _report(self):
+        _log.debug("Clipboard transaction timings: %s",
+                   ", ".join("%s %.1fms" % (phase, seconds * 1000) for phase, seconds in self.timings.items()))
+
+
+def wait_for_restore(timeout=None):
+    """Blocks until the last transaction has put the previous clip board
+    text back.
+
+    """
+    with _pendingLock:
+        pending = _pendingRestore
+    if pending is None or pending is threading.current_thread():
+        return
+    pending.join(timeout)
+    if pending.is_alive():
+        _log.warning("Clipboard restore still running after %.1fs", timeout)
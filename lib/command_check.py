@@ -0,0 +1,163 @@
+"""Headless behaviour checks of the grammar commands.
+
+Run from the grammar directory with "python -m lib.command_check". Spoken
+command sequences are mimicked through dragonfly's text engine against a
+StandInBackend, and the document and clipboard they leave behind are
+compared with what the editor should show. Each check runs several times
+with a slow clipboard, so races with the clipboard restore thread show up.
+The exit status is 1 if a check fails.
+
+"""
+import argparse
+import sys
+import time
+
+from dragonfly import Key, get_engine
+from dragonfly.engines.base.engine import MimicFailure
+
+from lib.standin import StandInBackend, wait_for_actions
+
+CONTEXT = {"executable": "idea64", "title": "project - app.ts"}
+CLIPBOARD_TEXT = "ORIGINAL"
+
+
+def say(engine, words, **context):
+    engine.mimic(words.split(), **dict(CONTEXT, **context))
+    wait_for_actions()
+
+
+def recognized(engine, words, **context):
+    try:
+        say(engine, words, **context)
+    except MimicFailure:
+        return False
+    return True
+
+
+def settle():
+    from lib.clipboard import wait_for_restore
+    wait_for_restore(5.0)
+
+
+def check_chained_counts(engine, backend):
+    """Two *_count commands in one utterance keep the user's clipboard."""
+    backend.reset("alpha beta gamma delta epsilon")
+    backend.clipboard = CLIPBOARD_TEXT
+    say(engine, "uppercase two lowercase one")
+    settle()
+    failures = []
+    if backend.document != "alpha beta gamma DELTA epsilon":
+        failures.append("document is %r" % backend.document)
+    if backend.clipboard != CLIPBOARD_TEXT:
+        failures.append("clipboard is %r" % backend.clipboard)
+    return failures
+
+
+def check_cross_group_chaining(engine, backend):
+    """Commands of different groups chain in one utterance, as far as their
+    groups are switched on and active in the foreground window.
+
+    """
+    backend.reset()
+    failures = []
+    expectations = [
+        ("down three equals", {}, True),
+        ("this equals camel case my value", {}, True),
+        ("if equals", {"title": "project - notes.txt"}, False),
+        ("down equals", {"title": "project - notes.txt"}, True),
+        ("keywords mode off", {}, True),
+        ("if equals", {}, False),
+        ("down equals", {}, True),
+        ("all modes on", {}, True),
+        ("if equals", {}, True),
+    ]
+    for words, context, expected in expectations:
+        if recognized(engine, words, **context) != expected:
+            failures.append("%r was%s recognized in %r" % (
+                words, "n't" if expected else "", context.get("title", CONTEXT["title"])))
+    return failures
+
+
+def check_undo_after_navigation(engine, backend):
+    """Undo reverses the last edit, even after moving the caret since."""
+    backend.reset("x ")
+    for words in ("dictate hello world", "left two", "undo that"):
+        say(engine, words)
+    if backend.document != "x ":
+        return ["document is %r" % backend.document]
+    return []
+
+
+def check_snippets(engine, backend):
+    """Snippets land the caret at their marker and keep the clipboard,
+    without the editor closing their brackets a second time.
+
+    """
+    backend.reset()
+    backend.clipboard = CLIPBOARD_TEXT
+    say(engine, "if while")
+    settle()
+    failures = []
+    expected = "if (while () {\n\n}) {\n\n}"
+    if backend.document != expected or backend.caret != expected.index(")"):
+        failures.append("document is %r with the caret at %d" % (backend.document, backend.caret))
+    if backend.clipboard != CLIPBOARD_TEXT:
+        failures.append("clipboard is %r" % backend.clipboard)
+    return failures
+
+
+def check_config_reload(engine, backend):
+    """A config change replaces only the rules of the group it changed."""
+    import _app_intellij
+    backend.reset()
+    before = dict((rule.name, rule) for rule in _app_intellij.commandGrammar.rules)
+    _app_intellij.defaultMappings["symbols"]["check reload"] = Key("f12")
+    try:
+        _app_intellij.reload_config()
+        after = dict((rule.name, rule) for rule in _app_intellij.commandGrammar.rules)
+        failures = ["%s was replaced" % name for name in sorted(after)
+                    if after[name] is not before.get(name) and "symbols" not in name and not name.startswith("_")]
+        if not recognized(engine, "down check reload"):
+            failures.append("the new command wasn't recognized")
+    finally:
+        del _app_intellij.defaultMappings["symbols"]["check reload"]
+        _app_intellij.reload_config()
+    return failures
+
+
+CHECKS = [
+    ("chained count commands", check_chained_counts),
+    ("cross-group chaining", check_cross_group_chaining),
+    ("undo after navigation", check_undo_after_navigation),
+    ("snippets", check_snippets),
+    ("config reload", check_config_reload),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="runs per check")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per clipboard write")
+    args = parser.parse_args(argv)
+    engine = get_engine("text")
+    import _app_intellij  # @UnusedImport Loads the grammars.
+    out = sys.stdout
+    failed = False
+    with StandInBackend(clipboardLatency=args.latency, autoClose=True) as backend:
+        for name, check in CHECKS:
+            start = time.time()
+            failures = []
+            failedRuns = 0
+            for i in range(args.runs):  # @UnusedVariable
+                runFailures = check(engine, backend)
+                failures.extend(runFailures)
+                failedRuns += bool(runFailures)
+            for failure in sorted(set(failures))[:5]:
+                out.write("FAIL %s: %s\n" % (name, failure))
+            out.write("%-40s %3d/%d runs failed %8.1fms\n" % (name, failedRuns, args.runs, (time.time() - start) * 1000))
+            failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+try:
+    import Queue as queue  # Python 2
+except ImportError:
+    import queue
+
+from lib.history import commandHistory
+from lib.planner import StepTypes, execute_plan, key_elements
+from lib.profiling import callProfiler
+from lib.trace import tracer
+
+_log = logging.getLogger("grammer.executor")
+
+# Longest a recognition waits for room in the queue before its plan is
+# queued anyway, so a hung plan can't block Dragon for good.
+SUBMIT_TIMEOUT = 10.0
+
+
+def plan_events(plan):
+    """Returns the number of key and text events a plan sends, counting
+    other actions as one.
+
+    Example:
+    plan_events([(StepTypes.key, "left:1000, down"), (StepTypes.text, "abc")]) => 1004
+
+    """
+    events = 0
+    for stepType, value in plan:
+        if stepType == StepTypes.key:
+            events += sum(repeat or 1 for name, repeat in key_elements(value))
+        elif stepType == StepTypes.text:
+            events += len(value)
+        else:
+            events += 1
+    return events
+
+
+class ActionExecutor(object):
+    """Runs action plans on a background thread, so the recognition callback
+    returns straight away and Dragon can handle the next utterance.
+
+    The queued and running plans send at most maxEvents key and text
+    events, so "stop" never has to wait long, whatever the repeat counts.
+    A plan that doesn't fit waits for room, with a warning in the log, and
+    a plan larger than that on its own waits for the queue to empty.
+    cancel() drops every queued plan and stops the running one before its
+    next step.
+
+    """
+
+    def __init__(self, maxEvents=2000):
+        self.maxEvents = maxEvents
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._pending = 0
+        self._events = 0
+        self._generation = 0
+        self._thread = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, plan, started=None, record=True):
+        """Queues a plan for execution, first waiting for room if too many
+        events are already in flight. If started is given, the time from
+        then until the plan has run is traced as the recognition latency. If
+        record is set, the plan and the edits it makes are added to the
+        command history.
+
+        """
+        events = plan_events(plan)
+        with self._lock:
+            if self._pending and self._events + events > self.maxEvents:
+                _log.warning("Waiting for %d queued events to run before queueing %d more", self._events, events)
+                deadline = time.time() + SUBMIT_TIMEOUT
+                while self._pending and self._events + events > self.maxEvents and time.time() < deadline:
+                    self._room.wait(max(deadline - time.time(), 0))
+            self._pending += 1
+            self._events += events
+            generation = self._generation
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="action-executor")
+                self._thread.daemon = True
+                self._thread.start()
+        entry = commandHistory.add(plan) if record else None
+        self._queue.put((generation, plan, entry, started, time.time(), events))
+
+    def cancel(self):
+        """Cancels all queued plans and the plan that is running."""
+        with self._lock:
+            self._generation += 1
+        _log.info("Cancelled %d plans", self._pending)
+
+    def _run(self):
+        while True:
+            generation, plan, entry, started, queued, events = self._queue.get()
+            start = time.time()
+            tracer.record("queue", queued, start - queued)
+            commandHistory.begin(entry)
+            try:
+                with callProfiler.section():
+                    for step in plan:
+                        if generation != self._generation:
+                            break
+                        if step[0] == StepTypes.key:
+                            commandHistory.record_keys(key_elements(step[1]))
+                        execute_plan([step])
+            except Exception:
+                _log.exception("Failed to execute plan")
+            finally:
+                commandHistory.end()
+                with self._lock:
+                    self._pending -= 1
+                    self._events -= events
+                    self._room.notify_all()
+                end = time.time()
+                tracer.record("execute", start, end - start, steps=len(plan))
+                if started is not None:
+                    tracer.record("recognition", started, end - started)
+
+
+executor = ActionExecutor()
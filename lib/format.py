@@ -1,40 +1,16 @@
+import operator
 import re
+from collections import OrderedDict
+from itertools import dropwhile
+
+from lib.identifiers import snap_identifier
+from lib.insert import insert_text
+from lib.spacing import SQUASH_RULES, space_operators
+from lib.text import lex_dragon_text
+from lib.text import letterMap  # noqa: F401 Moved to lib.text, still importable from here.
+from lib.trace import tracer
+from lib.vocabulary import recentIdentifiers
 
-from dragonfly import (
-    Clipboard,Key, Text
-)
-
-from lib.text import specialCharacterTranslations, specialCharacterTranslationsRe
-
-
-letterMap = {
-    "A\\letter": "alpha",
-    "B\\letter": "bravo",
-    "C\\letter": "charlie",
-    "D\\letter": "delta",
-    "E\\letter": "echo",
-    "F\\letter": "foxtrot",
-    "G\\letter": "golf",
-    "H\\letter": "hotel",
-    "I\\letter": "india",
-    "J\\letter": "juliet",
-    "K\\letter": "kilo",
-    "L\\letter": "lima",
-    "M\\letter": "mike",
-    "N\\letter": "november",
-    "O\\letter": "oscar",
-    "P\\letter": "papa",
-    "Q\\letter": "quebec",
-    "R\\letter": "romeo",
-    "S\\letter": "sierra",
-    "T\\letter": "tango",
-    "U\\letter": "uniform",
-    "V\\letter": "victor",
-    "W\\letter": "whiskey",
-    "X\\letter": "x-ray",
-    "Y\\letter": "yankee",
-    "Z\\letter": "zulu",
-}
 
 class FormatTypes:
     camelCase = 1
@@ -49,120 +25,129 @@ class FormatTypes:
 
 
 def strip_dragon_info(text):
-    newWords = []
-    words = str(text).split(" ")
+    return [written for written, spoken, tokenClass in lex_dragon_text(text)]
+
+
+def extract_dragon_info(text):
+    return [spoken for written, spoken, tokenClass in lex_dragon_text(text)]
+
+
+def tokenize_dragon_text(text):
+    """Splits dictated text into a stream of (written, spoken, tokenClass)
+    word tokens.
+
+    The dictation is split and scanned once, so a chain of formats can work
+    from the tokens instead of re-reading the Dragon info for every step.
+
+    Example:
+    "my .\\dot variable" => [("my", "my", TokenClasses.plain), (".", "dot", TokenClasses.special), ...].
+
+    """
+    return lex_dragon_text(text)
+
+
+_lower = operator.methodcaller("lower")
+_upper = operator.methodcaller("upper")
+
+
+def _camel_case_words(words):
+    parts = []
     for word in words:
-        word = specialCharacterTranslationsRe.sub(lambda m: specialCharacterTranslations[m.group()], word)
+        if parts:
+            parts.append(word.capitalize())
+        elif word:
+            parts.append(word[:1].lower() + word[1:])
+    return "".join(parts)
 
-        backslash_index = word.find("\\")
-        if backslash_index > -1:
-            word = word[:backslash_index]  # Remove spoken form info.
-        newWords.append(word)
-    return newWords
 
+def _pascal_case_words(words):
+    return "".join(word.capitalize() for word in words)
 
-def extract_dragon_info(text):
-    newWords = []
-    words = str(text).split(" ")
+
+def _separated_words(words, separator, convert=None, noSeparatorBefore=None):
+    """Joins words with a separator between normal words, ones that end in
+    a letter or digit, and converts each word with convert.
+
+    Builds a list of parts and joins it once, so the cost is linear in the
+    length of the dictation.
+
+    """
+    parts = []
+    lastChar = ""
     for word in words:
-        if word in letterMap.keys():
-            word = letterMap[word]
-        elif word.rfind("\\") > -1:
-            pos = word.rfind("\\") + 1
-            if (len(word) - 1) >= pos:
-                word = word[pos:]  # Remove written form info.
-            else:
-                word = ""
-        newWords.append(word)
-    return newWords
+        if lastChar.isalnum() and word[-1:].isalnum():
+            if noSeparatorBefore is None or word[0:1] != noSeparatorBefore:
+                parts.append(separator)
+        if convert is not None:
+            word = convert(word)
+        if word:
+            parts.append(word)
+            lastChar = word[-1]
+    return "".join(parts)
+
+
+def _snake_case_words(words):
+    return _separated_words(words, "_", convert=_lower)
+
+
+def _dashify_words(words):
+    return _separated_words(words, "-")
+
+
+def _dotify_words(words):
+    return _separated_words(words, ".")
+
+
+def _squash_words(words):
+    return "".join(words)
+
+
+def _upper_case_words(words):
+    return _separated_words(words, " ", convert=_upper)
+
+
+def _lower_case_words(words):
+    return _separated_words(words, " ", convert=_lower, noSeparatorBefore=".")
+
+
+def _spoken_form_words(words):
+    return " ".join(dropwhile(operator.not_, words))
 
 
 def format_camel_case(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        if newText == '':
-            newText = word[:1].lower() + word[1:]
-        else:
-            newText = '%s%s' % (newText, word.capitalize())
-    return newText
+    return _camel_case_words(strip_dragon_info(text))
 
 
 def format_pascal_case(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        newText = '%s%s' % (newText, word.capitalize())
-    return newText
+    return _pascal_case_words(strip_dragon_info(text))
 
 
 def format_snake_case(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        if newText != "" and newText[-1:].isalnum() and word[-1:].isalnum():
-            word = "_" + word  # Adds underscores between normal words.
-        newText += word.lower()
-    return newText
+    return _snake_case_words(strip_dragon_info(text))
 
 
 def format_dashify(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        if newText != "" and newText[-1:].isalnum() and word[-1:].isalnum():
-            word = "-" + word  # Adds dashes between normal words.
-        newText += word
-    return newText
+    return _dashify_words(strip_dragon_info(text))
 
 
 def format_dotify(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        if newText != "" and newText[-1:].isalnum() and word[-1:].isalnum():
-            word = "." + word  # Adds dashes between normal words.
-        newText += word
-    return newText
+    return _dotify_words(strip_dragon_info(text))
 
 
 def format_squash(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        newText = '%s%s' % (newText, word)
-    return newText
+    return _squash_words(strip_dragon_info(text))
 
 
 def format_upper_case(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        if newText != "" and newText[-1:].isalnum() and word[-1:].isalnum():
-            word = " " + word  # Adds spacing between normal words.
-        newText += word.upper()
-    return newText
+    return _upper_case_words(strip_dragon_info(text))
 
 
 def format_lower_case(text):
-    newText = ""
-    words = strip_dragon_info(text)
-    for word in words:
-        if newText != "" and newText[-1:].isalnum() and word[-1:].isalnum():
-            if newText[-1:] != "." and word[0:1] != ".":
-                word = " " + word  # Adds spacing between normal words.
-        newText += word.lower()
-    return newText
+    return _lower_case_words(strip_dragon_info(text))
 
 
 def format_spoken_form(text):
-    newText = ""
-    words = extract_dragon_info(text)
-    for word in words:
-        if newText != "":
-            word = " " + word
-        newText += word
-    return newText
+    return _spoken_form_words(extract_dragon_info(text))
 
 
 FORMAT_TYPES_MAP = {
@@ -177,22 +162,197 @@ FORMAT_TYPES_MAP = {
     FormatTypes.spokenForm: format_spoken_form,
 }
 
+# The word list formatter behind each format type, used by compiled
+# pipelines so the words only have to be tokenized once.
+FORMAT_WORDS_MAP = {
+    FormatTypes.camelCase: _camel_case_words,
+    FormatTypes.pascalCase: _pascal_case_words,
+    FormatTypes.snakeCase: _snake_case_words,
+    FormatTypes.squash: _squash_words,
+    FormatTypes.upperCase: _upper_case_words,
+    FormatTypes.lowerCase: _lower_case_words,
+    FormatTypes.dashify: _dashify_words,
+    FormatTypes.dotify: _dotify_words,
+    FormatTypes.spokenForm: _spoken_form_words,
+}
+
+_compiledPipelines = {}
+
+
+def compile_format(formatType):
+    """Returns a function that applies a format type, or a chain of format
+    types, to dictated text.
+
+    The dictation is tokenized once and every step of the chain works on the
+    output of the previous one without going back to the Dragon info, so a
+    multi-format command costs about the same as a single one. Compiled
+    pipelines are cached per chain.
+
+    Example:
+    compile_format([FormatTypes.snakeCase, FormatTypes.upperCase])("my new variable") => "MY_NEW_VARIABLE".
+
+    """
+    key = _format_key(formatType)
+    pipeline = _compiledPipelines.get(key)
+    if pipeline is None:
+        pipeline = _build_pipeline(key)
+        _compiledPipelines[key] = pipeline
+    return pipeline
+
+
+def _format_key(formatType):
+    if type(formatType) not in (type([]), type(())):
+        formatType = [formatType]
+    return tuple(formatType)
+
+
+def _build_pipeline(formatTypes):
+    firstStep = FORMAT_WORDS_MAP[formatTypes[0]]
+    useSpokenForm = formatTypes[0] == FormatTypes.spokenForm
+    nextSteps = [FORMAT_WORDS_MAP[value] for value in formatTypes[1:]]
+
+    def pipeline(text):
+        tokens = tokenize_dragon_text(text)
+        if useSpokenForm:
+            result = firstStep([spoken for written, spoken, tokenClass in tokens])
+        else:
+            result = firstStep([written for written, spoken, tokenClass in tokens])
+        for step in nextSteps:
+            result = step(result.split(" "))
+        return result
+
+    return pipeline
+
+
+class FormatCache(object):
+    """A bounded cache of formatted dictation, keyed on the raw dictation
+    string and the format chain. Each entry holds the formatted text and the
+    spoken words of the dictation. The least recently used entry is evicted
+    when the cache is full. A maxSize of 0 disables caching.
+
+    """
+
+    def __init__(self, maxSize=512):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached entry for key, or None if it is not cached."""
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries[key] = value  # Mark as most recently used.
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxSize <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def resize(self, maxSize):
+        self.maxSize = maxSize
+        while len(self._entries) > max(maxSize, 0):
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxSize": self.maxSize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+formatCache = FormatCache()
+
+
+def format_dictation(text, formatType):
+    """Returns dictated text formatted with a format type or chain of format
+    types. Results are memoized in formatCache, so a repeated identifier
+    skips tokenization completely.
+
+    Example:
+    format_dictation("my new variable", FormatTypes.camelCase) => "myNewVariable".
+
+    """
+    return _format_cached(text, formatType)[0]
+
+
+def _format_cached(text, formatType):
+    """Returns the formatted text and the spoken words of a dictation, both
+    from formatCache if it was formatted before.
+
+    """
+    formatKey = _format_key(formatType)
+    rawText = str(text)
+    cacheKey = (rawText, formatKey)
+    with tracer.span("format", text=rawText):
+        entry = formatCache.get(cacheKey)
+        if entry is None:
+            entry = (compile_format(formatKey)(rawText), tuple(extract_dragon_info(rawText)))
+            formatCache.put(cacheKey, entry)
+    return entry
+
+
+def format_batch(phrases, formatType):
+    """Formats many dictated phrases with the same format type or chain and
+    returns the results in order.
+
+    Nothing is typed and formatCache is left alone. All phrases share one
+    compiled pipeline and the lexer tables, and a phrase that comes up more
+    than once is only formatted once.
+
+    Example:
+    format_batch(["my new variable", "get user"], FormatTypes.camelCase) => ["myNewVariable", "getUser"].
+
+    """
+    pipeline = compile_format(formatType)
+    seen = {}
+    results = []
+    for phrase in phrases:
+        phrase = str(phrase)
+        result = seen.get(phrase)
+        if result is None:
+            result = seen[phrase] = pipeline(phrase)
+        results.append(result)
+    return results
+
+
+def format_identifier(text, formatType):
+    """Returns dictated text formatted as an identifier: with its case
+    fixed to match an identifier in the project with the same words, if
+    there is an index, and remembered for "recall".
+
+    Example:
+    format_identifier("get user id", FormatTypes.camelCase) => "getUserID", when the project declares getUserID.
+
+    """
+    formatted, spoken = _format_cached(text, formatType)
+    newText = snap_identifier(formatted)
+    recentIdentifiers.remember(spoken, newText)
+    return newText
+
 
 def format_text(text, formatType=None):
     if formatType:
-        if type(formatType) != type([]):
-            formatType = [formatType]
-        result = ""
-        method = None
-        for value in formatType:
-            if not result:
-                if formatType == FormatTypes.spokenForm:
-                    result = text.words
-                else:
-                    result = str(text)
-            method = FORMAT_TYPES_MAP[value]
-            result = method(result)
-        Text("%(text)s").execute({"text": result})
+        result = format_identifier(text, formatType)
+        insert_text(result)
 
 
 def camel_case_text(text):
@@ -202,8 +362,8 @@ def camel_case_text(text):
     "'camel case my new variable'" => "myNewVariable".
 
     """
-    newText = format_camel_case(text)
-    Text("%(text)s").execute({"text": newText})
+    newText = format_identifier(text, FormatTypes.camelCase)
+    insert_text(newText)
 
 
 def camel_case_count(n):
@@ -215,19 +375,17 @@ def camel_case_count(n):
     "'my new variable' *pause* 'camel case 3'" => "myNewVariable".
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        endSpace = cutText.endswith(' ')
-        text = _cleanup_text(cutText)
-        newText = _camelify(text.split(' '))
-        if endSpace:
-            newText = newText + ' '
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            endSpace = cutText.endswith(' ')
+            text = _cleanup_text(cutText)
+            newText = _camelify(text.split(' '))
+            if endSpace:
+                newText = newText + ' '
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
 
 
 def _camelify(words):
@@ -237,13 +395,7 @@ def _camelify(words):
     ["my", "new", "variable"] => "myNewVariable".
 
     """
-    newText = ''
-    for word in words:
-        if newText == '':
-            newText = word[:1].lower() + word[1:]
-        else:
-            newText = '%s%s' % (newText, word.capitalize())
-    return newText
+    return _camel_case_words(words)
 
 
 def pascal_case_text(text):
@@ -253,8 +405,8 @@ def pascal_case_text(text):
     "'pascal case my new variable'" => "MyNewVariable".
 
     """
-    newText = format_pascal_case(text)
-    Text("%(text)s").execute({"text": newText})
+    newText = format_identifier(text, FormatTypes.pascalCase)
+    insert_text(newText)
 
 
 def pascal_case_count(n):
@@ -266,19 +418,17 @@ def pascal_case_count(n):
     "'my new variable' *pause* 'pascal case 3'" => "MyNewVariable".
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        endSpace = cutText.endswith(' ')
-        text = _cleanup_text(cutText)
-        newText = text.title().replace(' ', '')
-        if endSpace:
-            newText = newText + ' '
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            endSpace = cutText.endswith(' ')
+            text = _cleanup_text(cutText)
+            newText = text.title().replace(' ', '')
+            if endSpace:
+                newText = newText + ' '
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
 
 
 def snake_case_text(text):
@@ -288,8 +438,8 @@ def snake_case_text(text):
     "'snake case my new variable'" => "my_new_variable".
 
     """
-    newText = format_snake_case(text)
-    Text("%(text)s").execute({"text": newText})
+    newText = format_identifier(text, FormatTypes.snakeCase)
+    insert_text(newText)
 
 
 def snake_case_count(n):
@@ -301,19 +451,17 @@ def snake_case_count(n):
     "'my new variable' *pause* 'snake case 3'" => "my_new_variable".
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        endSpace = cutText.endswith(' ')
-        text = _cleanup_text(cutText.lower())
-        newText = '_'.join(text.split(' '))
-        if endSpace:
-            newText = newText + ' '
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            endSpace = cutText.endswith(' ')
+            text = _cleanup_text(cutText.lower())
+            newText = '_'.join(text.split(' '))
+            if endSpace:
+                newText = newText + ' '
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
 
 
 def squash_text(text):
@@ -323,8 +471,8 @@ def squash_text(text):
     "'squash my new variable'" => "mynewvariable".
 
     """
-    newText = format_squash(text)
-    Text("%(text)s").execute({"text": newText})
+    newText = format_dictation(text, FormatTypes.squash)
+    insert_text(newText)
 
 
 def squash_count(n):
@@ -340,20 +488,18 @@ def squash_count(n):
     "( foo = bar, fee = fye )", 'squash 9'" => "(foo=bar, fee=fye)"
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        endSpace = cutText.endswith(' ')
-        text = _cleanup_text(cutText)
-        newText = ''.join(text.split(' '))
-        if endSpace:
-            newText = newText + ' '
-        newText = _expand_after_special_chars(newText)
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            endSpace = cutText.endswith(' ')
+            text = _cleanup_text(cutText)
+            newText = ''.join(text.split(' '))
+            if endSpace:
+                newText = newText + ' '
+            newText = space_operators(newText, SQUASH_RULES)
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
 
 
 def expand_count(n):
@@ -366,39 +512,17 @@ def expand_count(n):
     "result=(width1+width2)/2 'expand 9' " => "result = (width1 + width2) / 2"
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        endSpace = cutText.endswith(' ')
-        cutText = _expand_after_special_chars(cutText)
-        reg = re.compile(
-            r'([a-zA-Z0-9_\"\'\)][=\+\-\*/\%]|[=\+\-\*/\%][a-zA-Z0-9_\"\'\(])')
-        hit = reg.search(cutText)
-        count = 0
-        while hit and count < 10:
-            cutText = cutText[:hit.start() + 1] + ' ' + \
-                cutText[hit.end() - 1:]
-            hit = reg.search(cutText)
-            count += 1
-        newText = cutText
-        if endSpace:
-            newText = newText + ' '
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
-
-
-def _expand_after_special_chars(text):
-    reg = re.compile(r'[:,%][a-zA-Z0-9_\"\']')
-    hit = reg.search(text)
-    count = 0
-    while hit and count < 10:
-        text = text[:hit.start() + 1] + ' ' + text[hit.end() - 1:]
-        hit = reg.search(text)
-        count += 1
-    return text
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            endSpace = cutText.endswith(' ')
+            cutText = space_operators(cutText)
+            newText = cutText
+            if endSpace:
+                newText = newText + ' '
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
 
 
 def uppercase_text(text):
@@ -408,8 +532,8 @@ def uppercase_text(text):
     "'upper case my new variable'" => "MY NEW VARIABLE".
 
     """
-    newText = format_upper_case(text)
-    Text("%(text)s").execute({"text": newText})
+    newText = format_dictation(text, FormatTypes.upperCase)
+    insert_text(newText)
 
 
 def uppercase_count(n):
@@ -421,15 +545,13 @@ def uppercase_count(n):
     "'my new variable' *pause* 'upper case 3'" => "MY NEW VARIABLE".
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        newText = cutText.upper()
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            newText = cutText.upper()
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
 
 
 def lowercase_text(text):
@@ -439,8 +561,8 @@ def lowercase_text(text):
     "'lower case John Johnson'" => "john johnson".
 
     """
-    newText = format_lower_case(text)
-    Text("%(text)s").execute({"text": newText})
+    newText = format_dictation(text, FormatTypes.lowerCase)
+    insert_text(newText)
 
 
 def lowercase_count(n):
@@ -452,15 +574,39 @@ def lowercase_count(n):
     "'John Johnson' *pause* 'lower case 2'" => "john johnson".
 
     """
-    saveText = _get_clipboard_text()
-    cutText = _select_and_cut_text(n)
-    if cutText:
-        newText = cutText.lower()
-        newText = newText.replace("%", "%%")  # Escape any format chars.
-        Text(newText).execute()
-    else:  # Failed to get text from clipboard.
-        Key('c-v').execute()  # Restore cut out text.
-    _set_clipboard_text(saveText)
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            newText = cutText.lower()
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
+
+
+def snap_count(n):
+    """Replaces the identifier n words to the left of the cursor with the
+    closest identifier declared in the project, e.g. after a misrecognized
+    word. Unlike the formatters, which only fix case, this snaps to near
+    misses too.
+
+    Example:
+    "'getUsers' *pause* 'snap'" => "getUser", when the project declares getUser but not getUsers.
+
+    """
+    with _clipboard_transaction() as transaction:
+        cutText = transaction.cut_words(n)
+        if cutText:
+            identifier = cutText.rstrip(' ')
+            newText = snap_identifier(identifier, fuzzy=True) + cutText[len(identifier):]
+            insert_text(newText, transaction)
+        else:  # Failed to get text from clipboard.
+            transaction.restore_cut()
+
+
+def _clipboard_transaction():
+    # Deferred import, only the *_count commands use the clipboard.
+    from lib.clipboard import ClipboardTransaction
+    return ClipboardTransaction()
 
 
 def _cleanup_text(text):
@@ -489,27 +635,3 @@ def _cleanup_text(text):
     text = re.sub('[ \t\r\n]+', ' ', text)  # Any whitespaces to one space.
     text = prefixChars + text + suffixChars
     return text
-
-
-def _get_clipboard_text():
-    """Returns the text contents of the system clip board."""
-    clipboard = Clipboard()
-    return clipboard.get_system_text()
-
-
-def _select_and_cut_text(wordCount):
-    """Selects wordCount number of words to the left of the cursor and cuts
-    them out of the text. Returns the text from the system clip board.
-
-    """
-    clipboard = Clipboard()
-    clipboard.set_system_text('')
-    Key('cs-left/3:%s/10, c-x/10' % wordCount).execute()
-    return clipboard.get_system_text()
-
-
-def _set_clipboard_text(text):
-    """Sets the system clip board content."""
-    clipboard = Clipboard()
-    clipboard.set_text(text)  # Restore previous clipboard text.
-    clipboard.copy_to_system()
@@ -0,0 +1,282 @@
+"""Property and throughput checks for lib.format.
+
+Run from the grammar directory with "python -m lib.format_check". Every
+format function, the formatMap chains, _cleanup_text, _camelify and the
+expand/squash spacing are run over synthetic dictations of 1 to 10,000
+words, mixed with Dragon "written\\spoken" tokens. Properties that must
+hold for any input are checked on random dictations, and the time and
+memory per word at the largest size are compared with pinned budgets, the
+time relative to a reference loop timed in the same run. The exit status
+is 1 if a property fails or a budget is exceeded.
+
+"""
+import argparse
+import random
+import sys
+import time
+from functools import reduce
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+import lib.format
+from lib.format import FormatTypes
+from lib.spacing import SQUASH_RULES, space_operators
+from lib.text import letterMap, specialCharacterTranslations
+
+WORD_COUNTS = (1, 10, 100, 1000, 10000)
+
+PLAIN_WORDS = ["my", "new", "variable", "get", "User", "by", "ID", "HTTP", "x2", "it's", "New York\\new-york"]
+DRAGON_WORDS = sorted(specialCharacterTranslations) + sorted(letterMap)
+CODE_ATOMS = ["a", "b1", "x_y", "(", ")", "=", "==", "===", "+", "-", "*", "/", "=>", ",", ":", ";",
+              "+=", "&&", "||", "!", "2", "'s t'", "return", "<", ">=", "%", " ", "<<=", "??=", "|="]
+
+# Every binary and compound assignment operator of TypeScript, independent
+# of the spacing rules, so an operator missing from them shows up too.
+OPERATORS = ["=", "==", "===", "!=", "!==", "=>", "+", "-", "*", "/", "%", "**", "<", ">", "<=", ">=",
+             "<<", ">>", ">>>", "&", "|", "^", "&&", "||", "??", "+=", "-=", "*=", "/=", "%=", "**=",
+             "<<=", ">>=", ">>>=", "&=", "|=", "^=", "&&=", "||=", "??="]
+
+# The formatMap chains, see _app_intellij.py.
+CHAINS = [
+    [FormatTypes.squash, FormatTypes.lowerCase],
+    [FormatTypes.squash, FormatTypes.upperCase],
+    [FormatTypes.dashify, FormatTypes.lowerCase],
+    [FormatTypes.dashify, FormatTypes.upperCase],
+    [FormatTypes.dotify, FormatTypes.lowerCase],
+    [FormatTypes.dotify, FormatTypes.upperCase],
+    [FormatTypes.snakeCase, FormatTypes.upperCase],
+]
+
+# Budgets per word of a 10,000 word input: (time as a multiple of
+# reference_loop's, bytes allocated). The reference is timed right before
+# each function, so the speed and load of the machine cancel out. The time
+# budgets are about twice the worst ratio measured, so noise doesn't fail
+# the check, but a formatter that goes back to quadratic string building
+# does. --scale loosens or tightens them.
+BUDGETS = {
+    "format_camel_case": (8.0, 300),
+    "format_pascal_case": (8.0, 300),
+    "format_snake_case": (15.0, 300),
+    "format_dashify": (9.0, 300),
+    "format_dotify": (11.0, 300),
+    "format_squash": (6.0, 300),
+    "format_upper_case": (12.0, 300),
+    "format_lower_case": (15.0, 300),
+    "format_spoken_form": (6.5, 300),
+    "chain squash+lowercase": (6.0, 400),
+    "chain squash+uppercase": (7.0, 400),
+    "chain dashify+lowercase": (9.0, 400),
+    "chain dashify+uppercase": (10.0, 400),
+    "chain dotify+lowercase": (9.0, 400),
+    "chain dotify+uppercase": (10.0, 400),
+    "chain snakecase+uppercase": (13.0, 400),
+    "_cleanup_text": (1.0, 50),
+    "_camelify": (3.0, 300),
+    "expand spacing": (12.0, 100),
+    "squash spacing": (15.0, 100),
+}
+
+# Largest allowed growth in time from 1,000 to 10,000 words. Linear code
+# grows about 10 times, up to 35 on a busy machine, quadratic code 100 times.
+MAX_GROWTH = 40.0
+
+_typeNames = dict((value, name.lower()) for name, value in vars(FormatTypes).items() if not name.startswith("_"))
+
+
+def synthetic_dictation(random, words):
+    """Returns a dictation of words words, about a fifth of them Dragon
+    tokens.
+
+    """
+    return " ".join(random.choice(DRAGON_WORDS if random.random() < 0.2 else PLAIN_WORDS)
+                    for i in range(words))  # @UnusedVariable
+
+
+def reference_loop(text):
+    """The yardstick for the time budgets: plain Python string work per word."""
+    return " ".join([word.lower() for word in text.split(" ")])
+
+
+def synthetic_code(random, atoms):
+    return "".join(random.choice(CODE_ATOMS) for i in range(atoms))  # @UnusedVariable
+
+
+def chain_name(chain):
+    return "chain " + "+".join(_typeNames[value] for value in chain)
+
+
+def subjects():
+    """Returns (name, function, input maker) for every checked function."""
+    results = []
+    for value in sorted(lib.format.FORMAT_TYPES_MAP):
+        function = lib.format.FORMAT_TYPES_MAP[value]
+        results.append((function.__name__, function, synthetic_dictation))
+    for chain in CHAINS:
+        results.append((chain_name(chain), lib.format.compile_format(chain), synthetic_dictation))
+    results.append(("_cleanup_text", lib.format._cleanup_text, synthetic_code))
+    results.append(("_camelify", lambda text: lib.format._camelify(text.split(" ")), synthetic_dictation))
+    results.append(("expand spacing", space_operators, synthetic_code))
+    results.append(("squash spacing", lambda text: space_operators(text, SQUASH_RULES), synthetic_code))
+    return results
+
+
+def check_properties(text, code):
+    """Returns a description of every property that fails for a dictation
+    and a piece of code.
+
+    """
+    failures = []
+
+    def expect(condition, description):
+        if not condition:
+            failures.append("%s for %r" % (description, text if "spacing" not in description else code))
+
+    written = lib.format.strip_dragon_info(text)
+    squashed = "".join(written)
+    formatted = {}
+    for value, function in lib.format.FORMAT_TYPES_MAP.items():
+        formatted[value] = function(text)
+        expect(function(text) == formatted[value], "%s isn't deterministic" % function.__name__)
+        expect(lib.format.compile_format(value)(text) == formatted[value],
+               "compiled %s differs" % function.__name__)
+    for chain in CHAINS:
+        if "\\" in formatted[chain[0]]:
+            continue  # Applying the next step by itself would read it as Dragon info.
+        expected = reduce(lambda result, value: lib.format.FORMAT_TYPES_MAP[value](result), chain, text)
+        expect(lib.format.compile_format(chain)(text) == expected, "%s differs from applying each step" % chain_name(chain))
+
+    camel = formatted[FormatTypes.camelCase]
+    expect(camel.lower() == squashed.lower(), "camel case changes more than case")
+    expect(camel[:1] == camel[:1].lower(), "camel case starts upper case")
+    expect(formatted[FormatTypes.pascalCase].lower() == squashed.lower(), "pascal case changes more than case")
+    for value, separator in ((FormatTypes.snakeCase, "_"), (FormatTypes.dashify, "-"),
+                             (FormatTypes.dotify, "."), (FormatTypes.upperCase, " "), (FormatTypes.lowerCase, " ")):
+        result = formatted[value]
+        if value in (FormatTypes.snakeCase, FormatTypes.lowerCase):
+            expect(result == result.lower(), "%s isn't lower case" % _typeNames[value])
+            expected = squashed.lower()
+        elif value == FormatTypes.upperCase:
+            expect(result == result.upper(), "uppercase isn't upper case")
+            expected = squashed.upper()
+        else:
+            expected = squashed
+        expect(result.replace(separator, "") == expected.replace(separator, ""),
+               "%s adds more than %r separators" % (_typeNames[value], separator))
+    expect(formatted[FormatTypes.squash] == squashed, "squash adds characters")
+    spoken = lib.format.extract_dragon_info(text)
+    if spoken[:1] != [""]:
+        expect(formatted[FormatTypes.spokenForm] == " ".join(spoken), "spoken form isn't the spoken words")
+
+    cleaned = lib.format._cleanup_text(code)
+    expect(lib.format._cleanup_text(cleaned).strip() == cleaned.strip(), "_cleanup_text isn't idempotent")
+    expect("  " not in cleaned and "\t" not in cleaned, "_cleanup_text leaves whitespace runs")
+    expect(not any(c in cleaned[1:-1] for c in "_'"), "_cleanup_text leaves separators")
+    expect(" " not in lib.format._camelify(cleaned.split(" ")), "_camelify leaves spaces")
+    for rules, name in ((None, "expand spacing"), (SQUASH_RULES, "squash spacing")):
+        spaced = space_operators(code, rules)
+        expect(space_operators(spaced, rules) == spaced, "%s isn't idempotent" % name)
+        expect(spaced.replace(" ", "") == code.replace(" ", ""), "%s changes more than spaces" % name)
+    return failures
+
+
+def check_operators():
+    """Returns a description of every operator that spacing splits apart,
+    written next to its operands or already spaced.
+
+    """
+    failures = []
+    for operator in OPERATORS:
+        for code in ("a%sb" % operator, "a %s b" % operator, "(a)%s(b)" % operator):
+            for rules, name in ((None, "expand spacing"), (SQUASH_RULES, "squash spacing")):
+                spaced = space_operators(code, rules)
+                if operator not in spaced:
+                    failures.append("%s splits %r in %r: %r" % (name, operator, code, spaced))
+    return failures
+
+
+def measure(function, text, repeats):
+    """Returns the best time and the peak memory of function(text)."""
+    best = None
+    for i in range(repeats):  # @UnusedVariable
+        start = time.time()
+        function(text)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    allocated = 0
+    if tracemalloc:
+        tracemalloc.start()
+        function(text)
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, allocated
+
+
+def time_sizes(function, make_input, repeats):
+    """Returns the best time of function per input size, the best time of
+    reference_loop, timed right before the largest size, and the peak
+    memory at the largest size.
+
+    """
+    largest = WORD_COUNTS[-1]
+    times = {}
+    for count in WORD_COUNTS:
+        if count == largest:
+            reference = measure(reference_loop, synthetic_dictation(random.Random(largest), largest), repeats)[0]
+        times[count], allocated = measure(function, make_input(random.Random(count), count), repeats)
+    return times, reference, allocated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=2000, help="random dictations to check properties on")
+    parser.add_argument("--repeats", type=int, default=5, help="timing runs per size")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the time budgets")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    generator = random.Random(args.seed)
+    out = sys.stdout
+    failed = False
+
+    failures = []
+    for i in range(args.samples):  # @UnusedVariable
+        size = generator.randint(1, 12)
+        failures.extend(check_properties(synthetic_dictation(generator, size), synthetic_code(generator, size)))
+    for count in WORD_COUNTS:
+        failures.extend(check_properties(synthetic_dictation(generator, count), synthetic_code(generator, count)))
+    failures.extend(check_operators())
+    for failure in sorted(set(failures))[:20]:
+        out.write("FAIL %s\n" % failure)
+    out.write("%d property failures over %d samples\n" % (len(failures), args.samples + len(WORD_COUNTS)))
+    failed = failed or bool(failures)
+
+    largest = WORD_COUNTS[-1]
+    out.write("\n%-28s %9s %9s %9s %9s %9s %7s\n" % ("function", "us/word", "x ref", "budget", "B/word", "budget", "growth"))
+    for name, function, make_input in subjects():
+        timeBudget, memoryBudget = BUDGETS[name]
+        for attempt in range(2):  # A time or growth failure has to show up twice, not just once under load.
+            times, reference, allocated = time_sizes(function, make_input, args.repeats)
+            microseconds = times[largest] * 1e6 / largest
+            ratio = times[largest] / max(reference, 1e-9)
+            perWord = float(allocated) / largest
+            growth = times[largest] / max(times[largest // 10], 1e-6)
+            over = []
+            if ratio > timeBudget * args.scale:
+                over.append("time")
+            if growth > MAX_GROWTH and times[largest] > 0.005:  # Too fast to tell otherwise.
+                over.append("growth")
+            if not over:
+                break
+        if tracemalloc and perWord > memoryBudget:
+            over.append("memory")
+        out.write("%-28s %9.2f %9.1f %9.1f %9.0f %9d %7.1f %s\n" % (
+            name[:28], microseconds, ratio, timeBudget * args.scale, perWord, memoryBudget, growth,
+            "OVER " + ", ".join(over) if over else ""))
+        failed = failed or bool(over)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from dragonfly import Alternative, Compound, Literal, MappingRule, Optional, Sequence
+
+_log = logging.getLogger("grammer.cache")
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".grammar_cache.json")
+
+# Bump when the layout of the cached element trees changes.
+CACHE_VERSION = 1
+
+
+class _CachedCompound(Compound):
+    """A Compound built from an already parsed element instead of its spec."""
+
+    def __init__(self, spec, element, extras, value):
+        self._spec = spec
+        self._value = value
+        self._value_func = None
+        self._extras = extras
+        Alternative.__init__(self, (element,))
+
+
+class CachedMappingRule(MappingRule):
+    """A MappingRule that loads its parsed specs from an on-disk cache.
+
+    The cache is keyed by a hash of the specs and extras names, so it is
+    only used while neither has changed. Otherwise the specs are parsed as
+    usual and the cache is rewritten for the next load.
+
+    """
+
+    cachePath = CACHE_PATH
+
+    def __init__(self, name=None, mapping=None, extras=None, defaults=None,
+                 exported=None, context=None):
+        if mapping is None:
+            mapping = self.mapping
+        MappingRule.__init__(self, name, {}, extras, defaults, exported, context)
+        self._mapping = mapping
+        if mapping:
+            self._element = Alternative(build_compounds(self._name, mapping, self._extras, self.cachePath))
+
+
+def mapping_key(mapping, extras):
+    """Returns a hash of the specs and the names of the extras they use."""
+    digest = hashlib.sha1()
+    digest.update(("%d\n" % CACHE_VERSION).encode("utf-8"))
+    for spec in sorted(mapping):
+        digest.update(spec.encode("utf-8") + b"\n")
+    for name in sorted(extras):
+        digest.update(name.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def build_compounds(ruleName, mapping, extras, cachePath=CACHE_PATH):
+    """Returns a Compound for every spec in mapping, from the cache when it
+    is up to date.
+
+    """
+    start = time.time()
+    key = mapping_key(mapping, extras)
+    cache = _read_cache(cachePath)
+    entry = cache.get(ruleName)
+    if entry and entry.get("key") == key:
+        try:
+            trees = entry["specs"]
+            children = [_CachedCompound(spec, _load_element(trees[spec], extras), extras, value)
+                        for spec, value in mapping.items()]
+        except (KeyError, IndexError, TypeError, ValueError):
+            _log.warning("Ignoring damaged grammar cache entry for %s", ruleName)
+        else:
+            loadTime = time.time() - start
+            _log.info("Loaded %d specs for %s from cache in %.1fms, saving %.1fms of spec parsing",
+                      len(children), ruleName, loadTime * 1000, (entry["buildTime"] - loadTime) * 1000)
+            return children
+
+    children = [Compound(spec, elements=extras, value=value) for spec, value in mapping.items()]
+    buildTime = time.time() - start
+    try:
+        trees = dict((child._spec, _dump_element(child.children[0], extras)) for child in children)
+    except ValueError as e:
+        _log.info("Not caching specs for %s: %s", ruleName, e)
+    else:
+        cache[ruleName] = {"key": key, "buildTime": buildTime, "specs": trees}
+        _write_cache(cachePath, cache)
+    return children
+
+
+def _dump_element(element, extras):
+    if element.name and extras.get(element.name) is element:
+        return ["extra", element.name]
+    elementType = type(element)
+    if elementType is Literal:
+        return ["literal", " ".join(element.words)]
+    if elementType is Optional:
+        return ["optional", _dump_element(element.children[0], extras)]
+    if elementType is Sequence:
+        return ["sequence", [_dump_element(child, extras) for child in element.children]]
+    if elementType is Alternative:
+        return ["alternative", [_dump_element(child, extras) for child in element.children]]
+    raise ValueError("can't cache element %r" % element)
+
+
+def _load_element(tree, extras):
+    kind, content = tree
+    if kind == "extra":
+        return extras[content]
+    if kind == "literal":
+        return Literal(content)
+    if kind == "optional":
+        return Optional(_load_element(content, extras))
+    if kind == "sequence":
+        return Sequence([_load_element(child, extras) for child in content])
+    if kind == "alternative":
+        return Alternative([_load_element(child, extras) for child in content])
+    raise ValueError("unknown cached element %r" % kind)
+
+
+def _read_cache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        _log.warning("Ignoring unreadable grammar cache %s", path)
+        return {}
+
+
+def _write_cache(path, cache):
+    try:
+        with open(path, "w") as f:
+            json.dump(cache, f)
+    except IOError:
+        _log.exception("Failed to write grammar cache %s", path)
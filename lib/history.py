@@ -0,0 +1,150 @@
+import logging
+import threading
+from collections import deque
+
+_log = logging.getLogger("grammer.history")
+
+# Keys that change the text, each counted as one editor undo step.
+EDIT_KEYS = frozenset(["backspace", "delete", "enter", "tab", "c-x", "c-v", "c-d", "c-y", "csa-p"])
+
+
+class EditTypes:
+    insert = 1
+    keys = 2
+
+
+class HistoryEntry(object):
+    """One executed command: its plan and, in order, the edits it made.
+
+    Edits are (EditTypes.insert, text, replaced) for inserted text, where
+    replaced is the text cut out to make room for it, and
+    (EditTypes.keys, elements, None) for key steps, as (name, repeat) pairs.
+
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.edits = []
+
+    def undo_plan(self, later=()):
+        """Returns a plan that reverses this command in one batch.
+
+        The text the command inserted, the caret moves within it and the
+        text it replaced are replayed on a model of the edited region,
+        followed by the later edits, the caret moves of the navigation
+        commands since. If that explains everything, the caret is moved to
+        the end of the region, the region is deleted and the replaced text
+        is typed back. Otherwise, e.g. after enter or moving to another
+        line, the editor's own undo is pressed once per edit.
+
+        Example:
+        "camel case 3" on "my new variable" => [(key, "backspace:13"), (text, "my new variable")].
+
+        """
+        from lib.planner import StepTypes  # Deferred, lib.planner imports this module through lib.insert.
+        inserted = ""
+        caret = 0
+        removed = ""
+        reversible = True
+        undoSteps = 0
+        for editType, value, replaced in list(self.edits) + list(later):
+            if editType == EditTypes.insert:
+                undoSteps += 2 if replaced else 1
+                if replaced:
+                    # The cut words end at the caret and may reach back past
+                    # the start of the region.
+                    overlap = min(len(replaced), caret)
+                    inserted = inserted[:caret - overlap] + inserted[caret:]
+                    caret -= overlap
+                    removed = replaced[:len(replaced) - overlap] + removed
+                inserted = inserted[:caret] + value + inserted[caret:]
+                caret += len(value)
+                continue
+            for name, repeat in value:
+                if name == "left" and repeat and repeat <= caret:
+                    caret -= repeat
+                elif name == "right" and repeat and caret + repeat <= len(inserted):
+                    caret += repeat
+                elif name == "backspace" and repeat and repeat <= caret:
+                    undoSteps += 1
+                    inserted = inserted[:caret - repeat] + inserted[caret:]
+                    caret -= repeat
+                else:
+                    if name in EDIT_KEYS:
+                        undoSteps += 1
+                    reversible = False
+        if not reversible:
+            return [(StepTypes.key, "c-z:%d" % undoSteps)] if undoSteps else []
+        keys = []
+        if caret < len(inserted):
+            keys.append("right:%d" % (len(inserted) - caret))
+        if inserted:
+            keys.append("backspace:%d" % len(inserted))
+        plan = [(StepTypes.key, ", ".join(keys))] if keys else []
+        if removed:
+            plan.append((StepTypes.text, removed))
+        return plan
+
+
+class CommandHistory(object):
+    """A ring buffer of the last maxSize executed commands.
+
+    The executor adds a plan when it is submitted and journals the edits
+    made while it runs, so "undo that" can reverse the last command and
+    "repeat last command" can run its plan again.
+
+    """
+
+    def __init__(self, maxSize=50):
+        self.entries = deque(maxlen=maxSize)
+        self._running = threading.local()
+        self._lock = threading.Lock()
+
+    def add(self, plan):
+        entry = HistoryEntry(plan)
+        with self._lock:
+            self.entries.append(entry)
+        return entry
+
+    def last(self):
+        with self._lock:
+            return self.entries[-1] if self.entries else None
+
+    def begin(self, entry):
+        """Journals the edits made on this thread into entry."""
+        self._running.entry = entry
+
+    def end(self):
+        self._running.entry = None
+
+    def record_insert(self, text, replaced=""):
+        entry = getattr(self._running, "entry", None)
+        if entry is not None:
+            entry.edits.append((EditTypes.insert, text, replaced))
+
+    def record_keys(self, elements):
+        entry = getattr(self._running, "entry", None)
+        if entry is not None:
+            entry.edits.append((EditTypes.keys, elements, None))
+
+    def undo(self):
+        """Removes the last command that changed the text from the history,
+        along with any navigation after it, and reverses it. Run this on the
+        executor, so the command has finished first.
+
+        """
+        from lib.planner import execute_plan
+        plan = []
+        later = []
+        while not plan:
+            with self._lock:
+                if not self.entries:
+                    return
+                entry = self.entries.pop()
+            plan = entry.undo_plan(later)
+            later = entry.edits + later  # Navigation moved the caret since the edit.
+        _log.debug("Undoing %d edits with %r", len(entry.edits), plan)
+        execute_plan(plan)
+
+
+commandHistory = CommandHistory()
@@ -0,0 +1,289 @@
+import difflib
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+
+_log = logging.getLogger("grammer.identifiers")
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".identifiers")
+
+SOURCE_EXTENSIONS = (".ts", ".tsx", ".js", ".jsx")
+SKIP_DIRECTORIES = ("node_modules", ".git", ".idea", "dist", "build", "out", "coverage")
+
+# Declarations of classes, functions, variables and so on, and class members
+# at the start of a line.
+_declarationRe = re.compile(
+    r'\b(?:class|interface|enum|type|function|const|let|var|namespace)\s+([A-Za-z_$][\w$]*)'
+    r'|^\s*(?:(?:public|private|protected|static|async|readonly|abstract|get|set)\s+)*([A-Za-z_$][\w$]*)\s*[(:=]',
+    re.M)
+_keywords = frozenset([
+    "if", "for", "while", "switch", "catch", "return", "function", "constructor", "super", "else",
+    "case", "default", "new", "typeof", "delete", "await", "import", "export", "from",
+])
+
+_identifierRe = re.compile(r'^[A-Za-z_$][\w$]*$')
+
+# Number of index lines compared when looking for a near miss.
+MAX_CANDIDATES = 500
+
+
+def identifier_key(identifier):
+    """Returns the case and separator free form identifiers are matched on.
+
+    Example:
+    "my_new-Variable" => "mynewvariable".
+
+    """
+    return re.sub(r'[^0-9a-z]', '', identifier.lower())
+
+
+def identifier_style(identifier):
+    """Returns what distinguishes camelCase, PascalCase, snake_case and
+    UPPER_CASE forms of the same words.
+
+    """
+    return identifier[:1].isupper(), "_" in identifier.strip("_"), identifier.isupper()
+
+
+def scan_identifiers(path):
+    """Returns the identifiers declared in a source file."""
+    try:
+        with open(path, "rb") as f:
+            source = f.read().decode("utf-8", "replace")
+    except IOError:
+        return []
+    identifiers = set()
+    for match in _declarationRe.finditer(source):
+        identifier = match.group(1) or match.group(2)
+        if identifier not in _keywords:
+            identifiers.add(identifier)
+    return sorted(identifiers)
+
+
+class IdentifierIndex(object):
+    """An index of the identifiers declared in a project.
+
+    The index is kept on disk as sorted "key<tab>identifier" lines and
+    memory-mapped, so a lookup is a binary search without loading it. A
+    manifest keeps each file's mtime and identifiers, so update() only
+    rescans the files that changed.
+
+    """
+
+    def __init__(self, root, indexDir=INDEX_DIR):
+        self.root = os.path.abspath(root)
+        name = hashlib.sha1(self.root.encode("utf-8")).hexdigest()[:16]
+        self.indexPath = os.path.join(indexDir, name + ".idx")
+        self.manifestPath = os.path.join(indexDir, name + ".json")
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._open()
+
+    def update(self):
+        """Rescans the source files changed since the last update, and
+        rewrites the index if anything changed. Returns the number of files
+        rescanned.
+
+        """
+        manifest = self._read_manifest()
+        files = {}
+        rescanned = 0
+        for directory, directories, names in os.walk(self.root):
+            directories[:] = [d for d in directories if d not in SKIP_DIRECTORIES]
+            for name in names:
+                if not name.endswith(SOURCE_EXTENSIONS):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                entry = manifest.get(path)
+                if entry is None or entry["mtime"] != mtime:
+                    entry = {"mtime": mtime, "identifiers": scan_identifiers(path)}
+                    rescanned += 1
+                files[path] = entry
+        if rescanned or set(files) != set(manifest):
+            self._write(files)
+            _log.info("Indexed %d files under %s, %d rescanned", len(files), self.root, rescanned)
+        return rescanned
+
+    def lookup(self, key):
+        """Returns the identifiers whose key starts with key."""
+        return [identifier for lineKey, identifier in self._lines_from(identifier_key(key))]
+
+    def snap(self, identifier, fuzzy=False, cutoff=0.85):
+        """Returns the project identifier of the same style with the same
+        words as identifier, only differing in case. If fuzzy, the closest
+        one is returned, if it is close enough. Otherwise returns identifier
+        itself.
+
+        Example:
+        snap("getUserId") => "getUserID", when the project declares getUserID.
+        snap("getUsers", fuzzy=True) => "getUser", when the project declares getUser.
+
+        """
+        key = identifier_key(identifier)
+        if len(key) < 3:
+            return identifier
+        style = identifier_style(identifier)
+        for lineKey, candidate in self._lines_from(key):
+            if lineKey != key:
+                break  # Lines with longer keys follow the exact matches.
+            if identifier_style(candidate) == style:
+                return candidate
+        if not fuzzy:
+            return identifier
+        best, bestRatio = None, cutoff
+        matcher = difflib.SequenceMatcher(b=key)
+        for lineKey, candidate in self._lines_from(key[:2]):
+            if identifier_style(candidate) != style:
+                continue
+            matcher.set_seq1(lineKey)
+            if matcher.real_quick_ratio() > bestRatio and matcher.quick_ratio() > bestRatio:
+                ratio = matcher.ratio()
+                if ratio > bestRatio:
+                    best, bestRatio = candidate, ratio
+        return best or identifier
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _lines_from(self, prefix):
+        """Yields (key, identifier) for the index lines whose key starts with
+        prefix, in order.
+
+        """
+        with self._lock:
+            data = self._map
+            if data is None:
+                return
+            prefixBytes = prefix.encode("utf-8")
+            offset = self._lower_bound(data, prefixBytes)
+            lines = []
+            while offset < len(data):
+                end = data.find(b"\n", offset)
+                if end == -1:
+                    end = len(data)
+                lineKey, identifier = data[offset:end].split(b"\t", 1)
+                if not lineKey.startswith(prefixBytes):
+                    break
+                lines.append((lineKey.decode("utf-8"), identifier.decode("utf-8")))
+                if len(lines) > MAX_CANDIDATES:
+                    break
+                offset = end + 1
+        for line in lines:
+            yield line
+
+    @staticmethod
+    def _lower_bound(data, key):
+        """Returns the offset of the first line whose key is not below key."""
+        low, high = 0, len(data)
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind(b"\n", 0, middle) + 1
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = len(data)
+            if data[start:data.find(b"\t", start, end)] < key:
+                low = end + 1
+            else:
+                high = start
+        return low
+
+    def _write(self, files):
+        lines = set()
+        for entry in files.values():
+            for identifier in entry["identifiers"]:
+                key = identifier_key(identifier)
+                if key:
+                    lines.add((key, identifier))
+        directory = os.path.dirname(self.indexPath)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporaryPath = self.indexPath + ".tmp"
+        with open(temporaryPath, "wb") as f:
+            f.write(b"\n".join(("%s\t%s" % line).encode("utf-8") for line in sorted(lines)))
+        with self._lock:
+            self._close()  # A mapped file can't be replaced on Windows.
+            if os.path.exists(self.indexPath):
+                os.remove(self.indexPath)
+            os.rename(temporaryPath, self.indexPath)
+            self._open_locked()
+        with open(self.manifestPath, "w") as f:
+            json.dump(files, f)
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifestPath):
+            return {}
+        try:
+            with open(self.manifestPath) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _open(self):
+        with self._lock:
+            self._open_locked()
+
+    def _open_locked(self):
+        if os.path.exists(self.indexPath) and os.path.getsize(self.indexPath):
+            self._file = open(self.indexPath, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = None
+        self._file = None
+
+
+index = None
+
+
+def open_index(root, background=True):
+    """Opens the identifier index for a project and brings it up to date,
+    on a background thread by default.
+
+    """
+    global index
+    close_index()
+    index = IdentifierIndex(root)
+    if background:
+        refresh()
+    else:
+        index.update()
+    return index
+
+
+def close_index():
+    global index
+    if index is not None:
+        index.close()
+    index = None
+
+
+def refresh():
+    """Updates the open index on a background thread."""
+    if index is not None:
+        thread = threading.Thread(target=index.update, name="identifier-index")
+        thread.daemon = True
+        thread.start()
+
+
+def snap_identifier(identifier, fuzzy=False):
+    """Returns the identifier in the open index that identifier matches,
+    see IdentifierIndex.snap, or identifier if there is no index, it isn't
+    an identifier or nothing matches.
+
+    """
+    if index is None or not _identifierRe.match(identifier):
+        return identifier
+    return index.snap(identifier, fuzzy)
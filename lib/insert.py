@@ -0,0 +1,93 @@
+import logging
+import time
+
+from dragonfly import Text
+
+from lib.history import commandHistory
+from lib.trace import tracer
+
+_log = logging.getLogger("grammer.insert")
+
+
+class InsertStrategies:
+    type = 1
+    paste = 2
+
+
+class Inserter(object):
+    """Inserts generated text into the editor.
+
+    Short text is typed. Text of at least threshold characters is pasted
+    through the clipboard instead, so the editor doesn't react to every
+    character, and the user's clipboard is restored afterwards. If the paste
+    fails the text is typed after all. The time each strategy takes per
+    character is measured, to help tune the threshold.
+
+    """
+
+    def __init__(self, threshold=40):
+        self.threshold = threshold
+        self.stats = {
+            InsertStrategies.type: [0, 0, 0.0],  # Count, characters, seconds.
+            InsertStrategies.paste: [0, 0, 0.0],
+        }
+
+    def insert(self, text, transaction=None, strategy=None):
+        """Inserts text. A running ClipboardTransaction can be passed in, so
+        a paste doesn't start a second transaction. strategy forces typing or
+        pasting whatever the length of the text.
+
+        """
+        if not text:
+            return
+        replaced = transaction.take_cut_text() if transaction is not None else ""
+        commandHistory.record_insert(text, replaced)
+        if strategy is None:
+            strategy = InsertStrategies.paste if len(text) >= self.threshold else InsertStrategies.type
+        if strategy == InsertStrategies.paste and self._paste(text, transaction):
+            return
+        start = time.time()
+        with tracer.span("insert type", length=len(text)):
+            Text(text, static=True).execute()
+        self._record(InsertStrategies.type, text, start)
+
+    def suggested_threshold(self):
+        """Returns the text length where pasting becomes faster than typing,
+        from the measurements so far, or None if there aren't enough yet.
+
+        """
+        typeCount, typeChars, typeSeconds = self.stats[InsertStrategies.type]
+        pasteCount, pasteChars, pasteSeconds = self.stats[InsertStrategies.paste]
+        if not typeChars or not pasteCount:
+            return None
+        return int(pasteSeconds / pasteCount / (typeSeconds / typeChars)) + 1
+
+    def _paste(self, text, transaction):
+        start = time.time()
+        try:
+            with tracer.span("insert paste", length=len(text)):
+                if transaction is not None:
+                    pasted = transaction.paste(text)
+                else:
+                    from lib.clipboard import ClipboardTransaction
+                    with ClipboardTransaction() as transaction:
+                        pasted = transaction.paste(text)
+        except Exception:
+            _log.exception("Failed to paste text, typing it instead")
+            return False
+        if pasted:
+            self._record(InsertStrategies.paste, text, start)
+        return pasted
+
+    def _record(self, strategy, text, start):
+        stats = self.stats[strategy]
+        stats[0] += 1
+        stats[1] += len(text)
+        stats[2] += time.time() - start
+
+
+inserter = Inserter()
+
+
+def insert_text(text, transaction=None, strategy=None):
+    inserter.insert(text, transaction, strategy)
@@ -0,0 +1,142 @@
+import importlib
+import json
+import logging
+import os
+
+from dragonfly import Function
+from dragonfly.actions.action_base import DynStrActionBase
+
+from lib.planner import StepTypes, compile_plan
+from lib.snippets import Snippet
+
+_log = logging.getLogger("grammer.macros")
+
+MACRO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "macros.json")
+MACRO_VERSION = 1
+
+
+class MacroRecorder(object):
+    """Records the plans of recognized commands as a macro.
+
+    A recorded macro is compiled into one plan, with the key and text steps
+    of consecutive commands merged, and saved to path, so "play macro 20
+    times" is a single folded plan instead of 20 replays.
+
+    Steps are stored compactly: ["k", key spec], ["t", text],
+    ["f", "module:function", data] for Function actions and
+    ["a", "module:Class", spec] for other Key or Text actions, e.g.
+    DialogKey, and ["s", template] for snippets, with their extras filled
+    in. Anything else can be played this session but isn't saved.
+
+    """
+
+    def __init__(self, path=MACRO_PATH):
+        self.path = path
+        self.recording = None
+        self.macros = {}
+        self._loaded = False
+
+    def start(self):
+        self.recording = []
+
+    def record(self, plan):
+        if self.recording is not None:
+            self.recording.extend(plan)
+
+    def stop(self, name="default"):
+        """Stops recording and stores the macro. Returns its step count."""
+        if self.recording is None:
+            return 0
+        plan = compile_plan(self.recording)
+        self.recording = None
+        if not self._loaded:
+            self.load()
+        self.macros[name] = plan
+        self.save()
+        return len(plan)
+
+    def plan(self, name="default", count=1):
+        """Returns the plan for playing a macro count times, or None."""
+        if not self._loaded:
+            self.load()
+        plan = self.macros.get(name)
+        if plan is None:
+            return None
+        return compile_plan(plan, count)
+
+    def load(self):
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            if stored.get("version") == MACRO_VERSION:
+                for name, steps in stored["macros"].items():
+                    self.macros[name] = [_decode_step(step) for step in steps]
+        except (IOError, ValueError, KeyError, ImportError, AttributeError):
+            _log.exception("Failed to read macros %s", self.path)
+
+    def save(self):
+        if not self.path:
+            return
+        macros = {}
+        for name, plan in self.macros.items():
+            steps = [_encode_step(step) for step in plan]
+            if None in steps:
+                _log.warning("Macro %r has actions that can't be saved", name)
+                continue
+            macros[name] = steps
+        try:
+            with open(self.path, "w") as f:
+                json.dump({"version": MACRO_VERSION, "macros": macros}, f, separators=(",", ":"))
+        except IOError:
+            _log.exception("Failed to write macros %s", self.path)
+
+
+def _encode_step(step):
+    stepType, value = step
+    if stepType == StepTypes.key:
+        return ["k", value]
+    if stepType == StepTypes.text:
+        return ["t", value]
+    action, data = value
+    if type(action) is Function:
+        function = action._function
+        arguments = dict((name, value if isinstance(value, (int, float)) else str(value))
+                         for name, value in data.items() if not name.startswith("_"))
+        return ["f", "%s:%s" % (function.__module__, function.__name__), arguments]
+    if isinstance(action, Snippet):
+        return ["s", action.fill(data)]
+    if isinstance(action, DynStrActionBase):
+        spec = action._spec
+        if not action._static and data:
+            try:
+                spec = spec % data
+            except (KeyError, TypeError, ValueError):
+                return None
+        return ["a", "%s:%s" % (type(action).__module__, type(action).__name__), spec]
+    return None
+
+
+def _decode_step(step):
+    kind, value = step[0], step[1]
+    if kind == "k":
+        return (StepTypes.key, value)
+    if kind == "t":
+        return (StepTypes.text, value)
+    if kind == "f":
+        return (StepTypes.action, (Function(_import(value)), step[2]))
+    if kind == "a":
+        return (StepTypes.action, (_import(value)(step[2], static=True), {}))
+    if kind == "s":
+        return (StepTypes.action, (Snippet(value, static=True), {}))
+    raise ValueError("unknown macro step %r" % kind)
+
+
+def _import(path):
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+macroRecorder = MacroRecorder()
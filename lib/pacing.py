@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import time
+
+from dragonfly import Key, Window
+
+_log = logging.getLogger("grammer.pacing")
+
+# Starting delays per action type, in hundredths of a second as used in Key
+# specs. These are the values the grammar used to hard code.
+DEFAULT_DELAYS = {
+    "select": 3,
+    "cut": 10,
+    "dialog": 25,
+    "paste": 10,
+}
+
+# Actions whose effect can't be seen, calibrated from the latency of one that
+# can. Selecting a word takes the editor about as long as reacting to a cut.
+CALIBRATED_BY = {
+    "cut": ["select"],
+}
+
+# Actions whose effect always shows once the editor has handled them, and
+# the delays backed off with theirs when it doesn't show in time: the
+# editor is slower than the delays assume. Nothing shows when the editor
+# has read the clip board for a paste, so the paste delay is only ever
+# raised by a back-off, and relaxes back to its default while cuts are
+# seen in time.
+BACKED_OFF_WITH = {
+    "cut": ["paste"],
+}
+BACKOFF_FACTOR = 2
+MAX_DELAY = 50
+
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pacing.json")
+
+# How long to poll for an effect, as a multiple of its current delay.
+TIMEOUT_FACTOR = 4
+MIN_TIMEOUT = 0.1
+POLL_INTERVAL = 0.005
+# Timeouts in a row after which an effect that isn't backed off is taken to
+# be unobservable.
+MAX_MISSES = 3
+
+
+class DelayProfile(object):
+    """The keystroke delays for this machine, per action type.
+
+    Delays move towards the latencies observed while polling for the effect
+    of an action, plus a safety margin, and are saved to path so the
+    calibration carries over to the next session. When the effect of a cut
+    isn't seen in time, its delays are backed off. Any other effect that
+    isn't seen MAX_MISSES times in a row, e.g. a dialog that opens inside
+    the editor window, is only polled for as long as its delay, until it is
+    seen again.
+
+    """
+
+    def __init__(self, path=None, margin=1.5, smoothing=0.25):
+        self.path = path
+        self.margin = margin
+        self.smoothing = smoothing
+        self.delays = dict(DEFAULT_DELAYS)
+        self.misses = {}
+        self._loaded = False
+
+    def load(self):
+        self._loaded = True
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.delays.update(json.load(f))
+            except (IOError, ValueError):
+                _log.exception("Failed to read delay profile %s", self.path)
+
+    def save(self):
+        if self.path:
+            try:
+                with open(self.path, "w") as f:
+                    json.dump(self.delays, f, indent=4, sort_keys=True)
+            except IOError:
+                _log.exception("Failed to write delay profile %s", self.path)
+
+    def delay(self, action):
+        """Returns the delay for action in hundredths of a second."""
+        if not self._loaded:
+            self.load()  # Deferred until the first paced action.
+        return self.delays.get(action, 0)
+
+    def timeout(self, action):
+        """Returns how many seconds to poll for the effect of action."""
+        if action not in BACKED_OFF_WITH and self.misses.get(action, 0) >= MAX_MISSES:
+            return self.delay(action) / 100.0
+        return max(self.delay(action) * TIMEOUT_FACTOR / 100.0, MIN_TIMEOUT)
+
+    def observe(self, action, seconds):
+        """Moves the delay for action, and the actions calibrated by it,
+        towards an observed latency. The other delays backed off with it
+        move back towards their defaults.
+
+        """
+        if not self._loaded:
+            self.load()
+        self.misses[action] = 0
+        target = seconds * 100 * self.margin
+        changed = False
+        calibrated = [action] + CALIBRATED_BY.get(action, [])
+        for name in calibrated:
+            changed = self._move(name, target) or changed
+        for name in BACKED_OFF_WITH.get(action, []):
+            if name not in calibrated:
+                changed = self._move(name, DEFAULT_DELAYS[name]) or changed
+        if changed:
+            self.save()
+
+    def observe_timeout(self, action):
+        """Counts a poll for the effect of action that timed out, and backs
+        off its delays if the effect always shows.
+
+        """
+        if not self._loaded:
+            self.load()
+        self.misses[action] = self.misses.get(action, 0) + 1
+        if action in BACKED_OFF_WITH:
+            for name in [action] + BACKED_OFF_WITH[action]:
+                delay = min(max(self.delays.get(name, 1), 1) * BACKOFF_FACTOR, MAX_DELAY)
+                _log.info("The effect of %s wasn't seen in time, pacing for %s backed off from %s to %s",
+                          action, name, self.delays.get(name), delay)
+                self.delays[name] = delay
+            self.save()
+        elif self.misses[action] == MAX_MISSES:
+            _log.info("The effect of %s wasn't seen %d times, waiting %sms for it from now on",
+                      action, MAX_MISSES, self.delay(action) * 10)
+
+    def _move(self, name, target):
+        """Moves the delay for name a step towards target. Returns whether it
+        changed.
+
+        """
+        current = self.delays.get(name, target)
+        delay = max(1, int(round(current + self.smoothing * (target - current))))
+        if delay == self.delays.get(name):
+            return False
+        _log.debug("Pacing for %s changed from %s to %s", name, self.delays.get(name), delay)
+        self.delays[name] = delay
+        return True
+
+
+profile = DelayProfile(PROFILE_PATH)
+
+
+def wait_until(action, predicate):
+    """Polls predicate until it returns a true value, instead of sleeping for
+    a fixed delay. Gives up after the profile's timeout for action. Either
+    way the profile learns from it: the time the effect took, or that it
+    wasn't seen. Returns the last value returned by predicate.
+
+    """
+    timeout = profile.timeout(action)
+    start = time.time()
+    result = predicate()
+    while not result and time.time() - start < timeout:
+        time.sleep(POLL_INTERVAL)
+        result = predicate()
+    if result:
+        profile.observe(action, time.time() - start)
+    else:
+        profile.observe_timeout(action)
+    return result
+
+
+def _foreground_handle():
+    try:
+        return Window.get_foreground().handle
+    except Exception:
+        return None
+
+
+class DialogKey(Key):
+    """A Key action that opens a dialog.
+
+    Rather than waiting a fixed time, it waits until the dialog has taken
+    the foreground. If the foreground window can't be read, it falls back
+    to sleeping for the profile's dialog delay, and if dialogs keep opening
+    inside the editor window, it stops waiting longer than that delay.
+
+    Example:
+    DialogKey("c-g") + Text("%(n)d") + Key("enter")
+
+    """
+
+    def _execute(self, data=None):
+        before = _foreground_handle()
+        result = Key._execute(self, data)
+        if before is None:
+            time.sleep(profile.delay("dialog") / 100.0)
+        else:
+            wait_until("dialog", lambda: _foreground_handle() != before)
+        return result
@@ -0,0 +1,166 @@
+import re
+
+from dragonfly import Key, Text
+from dragonfly.actions.action_base import ActionSeries, BoundAction
+
+from lib.insert import insert_text
+from lib.trace import tracer
+
+# Largest repeat count sent in a single key element. Longer runs are split
+# into several elements of the same Key action.
+MAX_KEY_REPEAT = 500
+
+_keyElementRe = re.compile(r'^([^:/,]+?)(?::(\d+))?$')
+
+
+class StepTypes:
+    key = 1
+    text = 2
+    action = 3
+
+
+def plan_repetition(actions, count=1):
+    """Returns a plan for executing a sequence of actions count times.
+
+    The actions are flattened into key, text and other steps first. Runs of
+    Key actions are then merged into a single Key spec, with repeats of the
+    same key folded into one element with a multiplied count, and runs of
+    Text output are joined into one insertion. Any other action is kept as
+    is, in order.
+
+    Example:
+    plan_repetition([Key("down:5")], 200) => [(StepTypes.key, "down:500, down:500")]
+    plan_repetition([Text("ab")], 3) => [(StepTypes.text, "ababab")].
+
+    """
+    steps = []
+    for action in actions:
+        steps.extend(_flatten(action, {}))
+    return _fold(_merge(steps), count)
+
+
+def compile_plan(plan, count=1):
+    """Returns a plan that runs another plan, or the plans of several
+    recognitions joined together, count times with its steps merged as in
+    plan_repetition.
+
+    Example:
+    compile_plan([(StepTypes.key, "down"), (StepTypes.key, "down:2")], 2) => [(StepTypes.key, "down:6")].
+
+    """
+    steps = []
+    for stepType, value in plan:
+        if stepType == StepTypes.key:
+            value = key_elements(value)
+        steps.append((stepType, value))
+    return _fold(_merge(steps), count)
+
+
+def _fold(steps, count):
+    if len(steps) == 1:
+        stepType, value = steps[0]
+        if stepType == StepTypes.text:
+            return [(StepTypes.text, value * count)]
+        if stepType == StepTypes.key and len(value) == 1 and value[0][1]:
+            name, repeat = value[0]
+            return [(StepTypes.key, _key_spec([(name, repeat * count)]))]
+    return [_finish(step) for step in _merge(steps * count)]
+
+
+def execute_plan(plan):
+    for stepType, value in plan:
+        if stepType == StepTypes.key:
+            with tracer.span("key", spec=value):
+                Key(value, static=True).execute()
+        elif stepType == StepTypes.text:
+            with tracer.span("text", length=len(value)):
+                insert_text(value)
+        else:
+            action, data = value
+            with tracer.span("action", action=action):
+                action.execute(data)
+
+
+def _flatten(action, data):
+    if isinstance(action, BoundAction):
+        boundData = dict(data)
+        boundData.update(action._data or {})
+        return _flatten(action._action, boundData)
+    if type(action) is ActionSeries:
+        steps = []
+        for child in action.flat_action_list():
+            steps.extend(_flatten(child, data))
+        return steps
+    if type(action) in (Key, Text):
+        spec = _resolve_spec(action, data)
+        if spec is not None:
+            if type(action) is Key:
+                return [(StepTypes.key, key_elements(spec))]
+            return [(StepTypes.text, spec)]
+    return [(StepTypes.action, (action, data))]
+
+
+def _resolve_spec(action, data):
+    if action._static or not data:
+        return action._spec
+    try:
+        return action._spec % data
+    except (KeyError, TypeError, ValueError):
+        return None  # Let the action report the error itself.
+
+
+def key_elements(spec):
+    """Splits a Key spec into (name, repeat) elements. Elements with a
+    direction or delays can't be folded and are kept as (element, None).
+
+    """
+    elements = []
+    for element in spec.split(","):
+        element = element.strip()
+        match = _keyElementRe.match(element)
+        if match:
+            elements.append((match.group(1), int(match.group(2) or 1)))
+        else:
+            elements.append((element, None))
+    return elements
+
+
+def _merge(steps):
+    merged = []
+    for stepType, value in steps:
+        if merged and stepType == merged[-1][0] and stepType != StepTypes.action:
+            if stepType == StepTypes.text:
+                merged[-1] = (stepType, merged[-1][1] + value)
+            else:
+                merged[-1] = (stepType, _merge_key_elements(merged[-1][1], value))
+        else:
+            merged.append((stepType, value))
+    return merged
+
+
+def _merge_key_elements(elements, newElements):
+    elements = list(elements)
+    for name, repeat in newElements:
+        if elements and repeat and elements[-1][1] and elements[-1][0] == name:
+            elements[-1] = (name, elements[-1][1] + repeat)
+        else:
+            elements.append((name, repeat))
+    return elements
+
+
+def _finish(step):
+    if step[0] == StepTypes.key:
+        return (StepTypes.key, _key_spec(step[1]))
+    return step
+
+
+def _key_spec(elements):
+    specs = []
+    for name, repeat in elements:
+        if repeat is None:
+            specs.append(name)
+            continue
+        while repeat > 0:
+            specs.append("%s:%d" % (name, min(repeat, MAX_KEY_REPEAT)))
+            repeat -= MAX_KEY_REPEAT
+    return ", ".join(specs)
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+import time
+
+_log = logging.getLogger("grammer.recognitions")
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recognitions")
+
+
+class RecognitionLog(object):
+    """Appends every recognized command sequence to a JSON lines file, one
+    file per day in directory, for replaying with lib.replay. Nothing is
+    logged if directory is None.
+
+    Each line holds the time of the recognition, the repeat count, the
+    recognized words and per command its group, spec and extras. Dictation
+    extras are logged as the text the formatters get, including Dragon's
+    written\\spoken words.
+
+    Example:
+    {"time": 1700000000.0, "count": 1, "words": ["camel", "case", "three"],
+     "commands": [{"group": "formatting", "spec": "camel case <n>", "extras": {"n": 3}}]}
+
+    """
+
+    def __init__(self, directory=LOG_DIR):
+        self.directory = directory
+        self.enabled = True
+        self._file = None
+        self._day = None
+        self._lock = threading.Lock()
+
+    def record(self, sequence, count, words, started):
+        """Logs a recognition of a sequence of bound actions."""
+        if not self.enabled or self.directory is None:
+            return
+        line = json.dumps({
+            "time": started,
+            "count": count,
+            "words": list(words),
+            "commands": [command_entry(action) for action in sequence],
+        })
+        try:
+            with self._lock:
+                self._open(time.strftime("%Y%m%d", time.localtime(started)))
+                self._file.write(line + "\n")
+                self._file.flush()
+        except IOError:
+            _log.exception("Failed to log recognition, logging is turned off")
+            self.enabled = False
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self._day = None
+
+    def _open(self, day):
+        if day == self._day and self._file is not None:
+            return
+        if self._file is not None:
+            self._file.close()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._file = open(os.path.join(self.directory, "recognitions-%s.jsonl" % day), "a")
+        self._day = day
+
+
+def command_entry(action):
+    """Returns the group, spec and extras of a bound action from a
+    KeystrokeRule.
+
+    """
+    data = action._data or {}
+    node = data.get("_node")
+    compound = node.children[0].actor if node is not None and node.children else None
+    rule = node.parent.actor if node is not None and node.parent is not None else None
+    extras = {}
+    for name, value in data.items():
+        if not name.startswith("_"):
+            extras[name] = value if isinstance(value, (int, float)) else str(value)
+    return {"group": getattr(rule, "group", None), "spec": getattr(compound, "_spec", None), "extras": extras}
+
+
+def read_log(path):
+    """Yields the recognitions logged in a file, oldest first."""
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                _log.warning("Skipping unreadable line %d of %s", number, path)
+
+
+recognitionLog = RecognitionLog()
@@ -0,0 +1,86 @@
+"""Replays logged recognitions against a stand-in backend.
+
+Run from the grammar directory with "python -m lib.replay
+recognitions/recognitions-<day>.jsonl". Every logged command is looked up
+by its group and spec, bound to its logged extras and run through the
+planner, the executor and the formatters, with the output going to a
+StandInBackend. By default the original pauses between recognitions are
+kept, --speed replays faster and --fast doesn't wait at all. Plans still
+wait for room in the executor's queue, so none are dropped. A day of real
+use becomes a repeatable load test.
+
+"""
+import argparse
+import sys
+import time
+
+from dragonfly import get_engine
+from dragonfly.actions.action_base import BoundAction
+
+from lib.recognitions import read_log
+from lib.standin import StandInBackend, wait_for_actions
+from lib.trace import tracer
+
+# Longest pause kept between two recognitions, so idle time isn't replayed.
+MAX_PAUSE = 5.0
+
+
+def load_plans(paths):
+    """Returns (time, plan) for every logged recognition whose commands
+    still exist, and the number of recognitions skipped.
+
+    """
+    get_engine("text")
+    import _app_intellij
+    import lib.planner
+    plans = []
+    skipped = 0
+    for path in paths:
+        for recognition in read_log(path):
+            actions = []
+            for command in recognition["commands"]:
+                action = _app_intellij.commandGroups.get(command["group"], ({}, None))[0].get(command["spec"])
+                if action is None:
+                    break
+                actions.append(BoundAction(action, command["extras"]))
+            if len(actions) != len(recognition["commands"]):
+                skipped += 1
+                continue
+            plans.append((recognition["time"], lib.planner.plan_repetition(actions, recognition["count"])))
+    return plans, skipped
+
+
+def replay(plans, speed=1.0, fast=False, out=sys.stdout):
+    from lib.executor import executor
+    with StandInBackend() as backend:
+        start = time.time()
+        previous = None
+        for logged, plan in plans:
+            if fast:
+                wait_for_actions()
+            elif previous is not None:
+                time.sleep(min(max(logged - previous, 0), MAX_PAUSE) / speed)
+            previous = logged
+            executor.submit(plan, time.time(), record=False)
+        wait_for_actions()
+        elapsed = time.time() - start
+    out.write("%d recognitions replayed in %.2fs, %d events, %.2fs simulated playback\n" % (
+        len(plans), elapsed, len(backend.events), backend.simulatedTime))
+    for line in tracer.summary():
+        out.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("logs", nargs="+", help="recognition logs to replay, in order")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay this many times faster than recorded")
+    parser.add_argument("--fast", action="store_true", help="don't wait between recognitions")
+    args = parser.parse_args(argv)
+    plans, skipped = load_plans(args.logs)
+    if skipped:
+        sys.stderr.write("Skipped %d recognitions of commands that no longer exist\n" % skipped)
+    replay(plans, args.speed, args.fast)
+
+
+if __name__ == "__main__":
+    main()
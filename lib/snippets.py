@@ -0,0 +1,82 @@
+import logging
+
+from dragonfly import Key
+from dragonfly.actions.action_base import ActionBase, ActionError
+
+from lib.format import format_identifier
+from lib.history import commandHistory
+from lib.insert import InsertStrategies, insert_text
+from lib.planner import key_elements
+
+_log = logging.getLogger("grammer.snippets")
+
+# Where the caret ends up in a snippet template.
+CURSOR = "$0"
+
+
+class Snippet(ActionBase):
+    """Inserts a code template and puts the caret at its cursor marker.
+
+    The template is filled in with the extras, as in a Text spec, where
+    formats maps an extra to the format type applied to it. The caret
+    position is computed from the template: the whole snippet is pasted in
+    one go, however short, and one key step moves the caret back from the
+    end of the snippet to the marker. Typed, the editor would close the
+    brackets and indent the lines itself, on top of the template's own. It
+    may still re-indent the pasted lines, so the caret is placed by line and
+    by its distance from the end of its line.
+
+    Example:
+    Snippet("function %(text)s($0) {\\n\\n}", {"text": FormatTypes.pascalCase})
+    "function my function" => "function MyFunction() {\\n\\n}", then "up:2, end, left:3".
+
+    """
+
+    def __init__(self, template, formats=None, static=False):
+        ActionBase.__init__(self)
+        self.template = template
+        self.formats = formats or {}
+        self.static = static
+        self._str = "%r, %r" % (template, sorted(self.formats.items()))
+
+    def fill(self, data=None):
+        """Returns the template with the extras filled in, cursor marker included."""
+        if self.static:
+            return self.template
+        values = dict(data or {})
+        for name, formatType in self.formats.items():
+            if name in values:
+                values[name] = format_identifier(values[name], formatType)
+        try:
+            return self.template % values
+        except KeyError as e:
+            raise ActionError("Snippet %s is missing extra %s" % (self, e))
+
+    def render(self, data=None):
+        """Returns the text to insert and the key spec that moves the caret
+        from the end of the text to the cursor marker, or "" if it is already
+        there.
+
+        """
+        filled = self.fill(data)
+        index = filled.find(CURSOR)
+        if index < 0:
+            return filled, ""
+        after = filled[index + len(CURSOR):]
+        text = filled[:index] + after
+        linesBelow = after.count("\n")
+        charactersAfter = len(after.split("\n", 1)[0])
+        keys = []
+        if linesBelow:
+            keys.append("up:%d, end" % linesBelow)
+        if charactersAfter:
+            keys.append("left:%d" % charactersAfter)
+        return text, ", ".join(keys)
+
+    def _execute(self, data=None):
+        text, spec = self.render(data)
+        _log.debug("Inserting snippet %s, then %r", self, spec)
+        insert_text(text, strategy=InsertStrategies.paste)
+        if spec:
+            Key(spec, static=True).execute()
+            commandHistory.record_keys(key_elements(spec))
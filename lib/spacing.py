@@ -0,0 +1,133 @@
+import re
+
+# Operator -> (space before, space after), for "expand <n>".
+TYPESCRIPT_RULES = {
+    "=": (True, True),
+    "==": (True, True),
+    "===": (True, True),
+    "!=": (True, True),
+    "!==": (True, True),
+    "=>": (True, True),
+    "+": (True, True),
+    "-": (True, True),
+    "*": (True, True),
+    "/": (True, True),
+    "%": (True, True),
+    "**": (True, True),
+    "+=": (True, True),
+    "-=": (True, True),
+    "*=": (True, True),
+    "/=": (True, True),
+    "%=": (True, True),
+    "**=": (True, True),
+    "<<=": (True, True),
+    ">>=": (True, True),
+    ">>>=": (True, True),
+    "&=": (True, True),
+    "|=": (True, True),
+    "^=": (True, True),
+    "&&=": (True, True),
+    "||=": (True, True),
+    "??=": (True, True),
+    "<=": (True, True),
+    ">=": (True, True),
+    "&&": (True, True),
+    "||": (True, True),
+    "??": (True, True),
+    # Only kept whole: ">>" also closes nested type arguments, as in Array<Array<T>>.
+    "<<": (False, False),
+    ">>": (False, False),
+    ">>>": (False, False),
+    "++": (False, False),
+    "--": (False, False),
+    ",": (False, True),
+    ":": (False, True),
+    ";": (False, True),
+}
+
+# For "squash <n>": only commas, colons and percent chars keep a space after.
+SQUASH_RULES = {
+    ",": (False, True),
+    ":": (False, True),
+    "%": (False, True),
+    "%=": (False, False),
+}
+
+# A + or - after one of these, or at the start, is a sign, not an operator.
+UNARY_OPERATORS = ("+", "-")
+UNARY_AFTER_KEYWORDS = ("return", "case", "typeof", "in", "of", "yield", "await", "throw")
+
+# No space is added before these, even after a comma or colon.
+_closing = ")]};,"
+
+_tokenizers = {}
+
+
+def _tokenizer(rules):
+    key = tuple(sorted(rules))
+    tokenRe = _tokenizers.get(key)
+    if tokenRe is None:
+        operators = sorted(rules, key=len, reverse=True)  # Longest match first.
+        tokenRe = re.compile(
+            r'''(?P<string>"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?|`(?:[^`\\]|\\.)*`?)'''
+            r'''|(?P<space>\s+)'''
+            r'''|(?P<word>[\w$.]+)'''
+            r'''|(?P<op>%s)'''
+            r'''|(?P<other>.)''' % "|".join(re.escape(operator) for operator in operators),
+            re.S)
+        _tokenizers[key] = tokenRe
+    return tokenRe
+
+
+def _is_sign(previous):
+    if previous is None:
+        return True
+    kind, value = previous
+    if kind == "op":
+        return True
+    if kind == "other":
+        return value in "([{?!"
+    return kind == "word" and value in UNARY_AFTER_KEYWORDS
+
+
+def space_operators(text, rules=None):
+    """Adds the spaces that rules ask for around operators, in a single pass
+    over the text. Existing whitespace and the contents of string literals
+    are left alone, and a leading + or - is treated as a sign.
+
+    Example:
+    "result=(width1+width2)/2" => "result = (width1 + width2) / 2"
+    "x=-1,y=foo(a,'b=c')" => "x = -1, y = foo(a, 'b=c')"
+
+    """
+    if rules is None:
+        rules = TYPESCRIPT_RULES
+    parts = []
+    previous = None  # The last token that wasn't whitespace.
+    pendingSpace = False
+    lastIsSpace = True  # Nothing is added at the start of the text.
+    for match in _tokenizer(rules).finditer(text):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "space":
+            parts.append(value)
+            pendingSpace = False
+            lastIsSpace = True
+            continue
+
+        spaceAfter = False
+        if kind == "op":
+            spaceBefore, spaceAfter = rules[value]
+            if value in UNARY_OPERATORS and _is_sign(previous):
+                spaceBefore = spaceAfter = False
+            pendingSpace = pendingSpace or spaceBefore
+        elif value in _closing:
+            pendingSpace = False
+
+        if pendingSpace and not lastIsSpace:
+            parts.append(" ")
+        parts.append(value)
+        pendingSpace = spaceAfter
+        lastIsSpace = False
+        previous = (kind, value)
+    return "".join(parts)
@@ -0,0 +1,217 @@
+"""A stand-in output backend for running the grammar without Dragon,
+Natlink or Windows.
+
+While installed, Key, Text and Function actions, the clipboard and the
+foreground window are served by a StandInBackend. It records every event
+and the time the real system would have taken, instead of touching the
+keyboard or clipboard.
+
+"""
+import time
+
+from dragonfly import Clipboard, Function, Key, Text, Window
+
+from lib import pacing
+from lib.recognitions import recognitionLog
+
+
+# Text sends newlines and tabs as key names.
+_characters = dict((symbol, character) for character, symbol in Text._specials.items())
+
+# The brackets the editor closes as they are typed.
+_closers = {"(": ")", "[": "]", "{": "}"}
+
+
+class _StandInWindow(object):
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.executable = "idea64"
+        self.title = ""
+        self.cls_name = ""
+
+
+class StandInBackend(object):
+    """Records emitted events and simulated timing.
+
+    A tiny document model with a caret follows the text that is typed, so
+    selecting and cutting words to the left of the caret behaves like the
+    editor: the cut words land on the clipboard and a paste types the
+    clipboard back. The arrow keys, home, end, backspace and delete move
+    the caret and edit around it. With autoClose, typed text is edited like
+    the editor does: an opening bracket adds its closer, typing over a
+    closer moves past it and enter between braces opens an indented line.
+    Pasted text is taken as is.
+
+    Example:
+    with StandInBackend() as backend:
+        Key("down:3").execute()
+    backend.events => [("key", "down", 3)]
+
+    """
+
+    def __init__(self, keyEventTime=0.001, charTime=0.001, document="", clipboardLatency=0.0, autoClose=False):
+        self.keyEventTime = keyEventTime
+        self.charTime = charTime
+        self.clipboardLatency = clipboardLatency
+        self.autoClose = autoClose
+        self.document = document
+        self.caret = len(document)
+        self.clipboard = ""
+        self.events = []
+        self.simulatedTime = 0.0
+        self._selectedWords = 0
+        self._windowHandle = 1
+        self._saved = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.uninstall()
+        return False
+
+    def reset(self, document=""):
+        self.document = document
+        self.caret = len(document)
+        self.events = []
+        self.simulatedTime = 0.0
+        self._selectedWords = 0
+
+    def install(self):
+        backend = self
+        self._saved = [
+            (Key, "_execute_events", Key.__dict__["_execute_events"]),
+            (Text, "_execute_events", Text.__dict__["_execute_events"]),
+            (Function, "_execute", Function.__dict__["_execute"]),
+            (Clipboard, "get_system_text", Clipboard.__dict__["get_system_text"]),
+            (Clipboard, "set_system_text", Clipboard.__dict__["set_system_text"]),
+            (Clipboard, "copy_to_system", Clipboard.__dict__["copy_to_system"]),
+            (Window, "get_foreground", Window.__dict__["get_foreground"]),
+            (pacing.profile, "path", pacing.profile.path),
+            (recognitionLog, "directory", recognitionLog.directory),
+        ]
+        originalFunctionExecute = Function.__dict__["_execute"]
+
+        def function_execute(action, data=None):
+            backend.events.append(("function", getattr(action._function, "__name__", repr(action._function))))
+            return originalFunctionExecute(action, data)
+
+        Key._execute_events = lambda action, events: backend.key_events(events)
+        Text._execute_events = lambda action, events: backend.text_events(events)
+        Function._execute = function_execute
+        Clipboard.get_system_text = classmethod(lambda cls: backend.clipboard)
+        Clipboard.set_system_text = classmethod(lambda cls, text: backend.set_clipboard(text))
+        Clipboard.copy_to_system = lambda clipboard, clear=True: backend.set_clipboard(clipboard.get_text())
+        Window.get_foreground = classmethod(lambda cls: _StandInWindow(backend._windowHandle))
+        pacing.profile.path = None  # Don't save calibrations made against the stand-in.
+        recognitionLog.directory = None  # Nor log the recognitions it runs.
+
+    def uninstall(self):
+        for owner, name, value in self._saved or []:
+            setattr(owner, name, value)
+        self._saved = None
+
+    def set_clipboard(self, text):
+        if self.clipboardLatency:
+            time.sleep(self.clipboardLatency)  # Really waits, to expose races with the restore thread.
+        self.clipboard = text or ""
+
+    def key_events(self, events):
+        for event in events:
+            keyname = getattr(event, "keyname", event)
+            modifiers = getattr(event, "modifiers", ())
+            repeat = getattr(event, "repeat", 1) or 1
+            self.events.append(("key", keyname, repeat))
+            self.simulatedTime += self.keyEventTime * repeat
+            self._windowHandle += 1  # Any key may open or close a dialog.
+            self._apply_key(keyname, modifiers, repeat)
+
+    def text_events(self, events):
+        text = "".join(_characters.get(event, event) for event in events)
+        self.events.append(("text", text))
+        self.simulatedTime += self.charTime * len(text)
+        if self.autoClose:
+            for character in text:
+                self._type(character)
+        else:
+            self._insert(text)
+        self._selectedWords = 0
+
+    def _type(self, character):
+        following = self.document[self.caret:self.caret + 1]
+        if character in _closers.values() and character == following:
+            self.caret += 1
+        elif character in _closers:
+            self._insert(character + _closers[character])
+            self.caret -= 1
+        elif character == "\n" and self.document[self.caret - 1:self.caret] == "{" and following == "}":
+            self._insert("\n    \n")
+            self.caret -= 1
+        else:
+            self._insert(character)
+
+    def _insert(self, text):
+        self.document = self.document[:self.caret] + text + self.document[self.caret:]
+        self.caret += len(text)
+
+    def _apply_key(self, keyname, modifiers, repeat):
+        modifiers = [str(modifier) for modifier in modifiers]
+        if keyname == "left" and len(modifiers) == 2:
+            self._selectedWords += repeat
+            return
+        if keyname == "x" and modifiers and self._selectedWords:
+            words = self.document[:self.caret].split(" ")
+            keep = max(len(words) - self._selectedWords, 0)
+            self.clipboard = " ".join(words[keep:])
+            before = " ".join(words[:keep]) + (" " if keep else "")
+            self.document = before + self.document[self.caret:]
+            self.caret = len(before)
+        elif keyname == "v" and modifiers:
+            self._insert(self.clipboard)
+        elif modifiers:
+            pass
+        elif keyname == "backspace":
+            start = max(self.caret - repeat, 0)
+            self.document = self.document[:start] + self.document[self.caret:]
+            self.caret = start
+        elif keyname == "delete":
+            self.document = self.document[:self.caret] + self.document[self.caret + repeat:]
+        elif keyname == "left":
+            self.caret = max(self.caret - repeat, 0)
+        elif keyname == "right":
+            self.caret = min(self.caret + repeat, len(self.document))
+        elif keyname == "home":
+            self.caret = self.document.rfind("\n", 0, self.caret) + 1
+        elif keyname == "end":
+            end = self.document.find("\n", self.caret)
+            self.caret = len(self.document) if end < 0 else end
+        elif keyname in ("up", "down"):
+            for i in range(repeat):  # @UnusedVariable
+                self._move_line(-1 if keyname == "up" else 1)
+        self._selectedWords = 0
+
+    def _move_line(self, direction):
+        start = self.document.rfind("\n", 0, self.caret) + 1
+        column = self.caret - start
+        if direction < 0:
+            if start == 0:
+                return
+            lineStart = self.document.rfind("\n", 0, start - 1) + 1
+        else:
+            lineStart = self.document.find("\n", self.caret) + 1
+            if lineStart == 0:
+                return
+        lineEnd = self.document.find("\n", lineStart)
+        if lineEnd < 0:
+            lineEnd = len(self.document)
+        self.caret = min(lineStart + column, lineEnd)
+
+
+def wait_for_actions(timeout=10.0):
+    """Blocks until the background executor has run everything queued."""
+    from lib.executor import executor
+    deadline = time.time() + timeout
+    while executor.pending and time.time() < deadline:
+        time.sleep(0.0005)
@@ -0,0 +1,102 @@
+import logging
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import __builtin__ as builtins  # Python 2
+except ImportError:
+    import builtins
+
+_log = logging.getLogger("grammer.startup")
+
+
+class StartupProfiler(object):
+    """Records how long loading the grammar module takes, per phase and per
+    imported module.
+
+    Inside timing_imports(), the first import of every module is timed.
+    Both the total time and the time spent in the module itself, excluding
+    its own imports, are kept. Phases are timed between calls to mark().
+
+    Example:
+    profiler.start()
+    with profiler.timing_imports():
+        ...imports...
+    profiler.mark("imports")
+    ...build rules...
+    profiler.mark("rules")
+    profiler.stop()
+
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.imports = OrderedDict()
+        self._stack = []
+        self._originalImport = None
+        self._last = None
+        self._started = None
+
+    def start(self):
+        """Starts timing a load, forgetting the phases and imports of any
+        earlier one, e.g. before Natlink reloaded the grammar.
+
+        """
+        self.phases.clear()
+        self.imports.clear()
+        del self._stack[:]
+        self._started = self._last = time.time()
+
+    @contextmanager
+    def timing_imports(self):
+        """Times the imports in the body of a with statement. The import
+        hook is removed again even if an import fails, so it never outlives
+        a failed grammar load.
+
+        """
+        if self._originalImport is None:
+            self._originalImport = builtins.__import__
+            builtins.__import__ = self._import
+        try:
+            yield
+        finally:
+            builtins.__import__ = self._originalImport
+            self._originalImport = None
+
+    def mark(self, phase):
+        """Records the time since the previous mark as phase."""
+        now = time.time()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def stop(self):
+        self.report()
+
+    def report(self, top=15):
+        total = time.time() - self._started
+        _log.info("Grammar loaded in %.1fms: %s", total * 1000,
+                  ", ".join("%s %.1fms" % (phase, seconds * 1000) for phase, seconds in self.phases.items()))
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (inclusive, exclusive) in slowest:
+            _log.info("  import %-40s %7.1fms total %7.1fms self", name, inclusive * 1000, exclusive * 1000)
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._originalImport(name, globals, locals, fromlist, level)
+        start = time.time()
+        self._stack.append(0.0)
+        try:
+            module = self._originalImport(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            childTime = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+        if name not in self.imports:
+            self.imports[name] = (elapsed, elapsed - childTime)
+        return module
+
+
+profiler = StartupProfiler()
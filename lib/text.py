@@ -1,5 +1,3 @@
-import re
-
 specialCharacterTranslations = {
     "?\\question-mark": "?",
     ":\\colon": ":",
@@ -34,4 +32,81 @@ specialCharacterTranslations = {
     "\"\\left-double-quote": "\"",
 }
 
-specialCharacterTranslationsRe = re.compile('|'.join(re.escape(key) for key in specialCharacterTranslations.keys()))
+letterMap = {
+    "A\\letter": "alpha",
+    "B\\letter": "bravo",
+    "C\\letter": "charlie",
+    "D\\letter": "delta",
+    "E\\letter": "echo",
+    "F\\letter": "foxtrot",
+    "G\\letter": "golf",
+    "H\\letter": "hotel",
+    "I\\letter": "india",
+    "J\\letter": "juliet",
+    "K\\letter": "kilo",
+    "L\\letter": "lima",
+    "M\\letter": "mike",
+    "N\\letter": "november",
+    "O\\letter": "oscar",
+    "P\\letter": "papa",
+    "Q\\letter": "quebec",
+    "R\\letter": "romeo",
+    "S\\letter": "sierra",
+    "T\\letter": "tango",
+    "U\\letter": "uniform",
+    "V\\letter": "victor",
+    "W\\letter": "whiskey",
+    "X\\letter": "x-ray",
+    "Y\\letter": "yankee",
+    "Z\\letter": "zulu",
+}
+
+
+class TokenClasses:
+    plain = 1
+    special = 2
+    letter = 3
+    dictated = 4
+
+
+def _build_word_table():
+    """Maps every Dragon word with a known translation to its token."""
+    table = {}
+    for word, written in specialCharacterTranslations.items():
+        table[word] = (written, word[word.rfind("\\") + 1:], TokenClasses.special)
+    for word, spoken in letterMap.items():
+        table[word] = (word[:word.find("\\")], spoken, TokenClasses.letter)
+    return table
+
+
+_wordTable = None  # Built on first use.
+
+
+def lex_dragon_text(text):
+    """Returns a (written, spoken, tokenClass) token for every word of the
+    dictated text in a single linear scan.
+
+    Special characters and NATO letters are looked up as whole words in a
+    precomputed table. Any other "written\\spoken" word is split at its
+    first and last backslash.
+
+    Example:
+    "my ,\\comma A\\letter New\\new" => [("my", "my", TokenClasses.plain),
+    (",", "comma", TokenClasses.special), ("A", "alpha", TokenClasses.letter),
+    ("New", "new", TokenClasses.dictated)].
+
+    """
+    global _wordTable
+    if _wordTable is None:
+        _wordTable = _build_word_table()
+    wordTable = _wordTable
+    tokens = []
+    for word in str(text).split(" "):
+        token = wordTable.get(word)
+        if token is None:
+            if "\\" in word:
+                token = (word[:word.find("\\")], word[word.rfind("\\") + 1:], TokenClasses.dictated)
+            else:
+                token = (word, word, TokenClasses.plain)
+        tokens.append(token)
+    return tokens
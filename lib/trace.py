@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+_log = logging.getLogger("grammer.trace")
+
+TRACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "traces")
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class Tracer(object):
+    """Records timed spans for each recognition: formatting, clipboard
+    phases and every executed action.
+
+    The most recent durations of each span are kept for latency histograms,
+    and the most recent spans for export as a Chrome trace
+    (chrome://tracing or https://ui.perfetto.dev).
+
+    Example:
+    with tracer.span("format", text="my new variable"):
+        ...
+
+    """
+
+    def __init__(self, windowSize=1000, maxEvents=20000):
+        self.enabled = True
+        self.durations = defaultdict(lambda: deque(maxlen=windowSize))
+        self.events = deque(maxlen=maxEvents)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        """Times the body of a with statement as a span called name."""
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.time() - start, **args)
+
+    def record(self, name, start, duration, **args):
+        """Records a span that has already finished."""
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": int(start * 1000000),
+            "dur": int(duration * 1000000),
+            "pid": os.getpid(),
+            "tid": threading.current_thread().name,
+        }
+        if args:
+            event["args"] = dict((key, str(value)) for key, value in args.items())
+        with self._lock:
+            self.durations[name].append(duration)
+            self.events.append(event)
+
+    def percentiles(self, name, points=(50, 90, 99)):
+        """Returns {percentile: milliseconds} over the recent spans called
+        name.
+
+        """
+        with self._lock:
+            durations = sorted(self.durations.get(name, ()))
+        if not durations:
+            return {}
+        return dict((point, durations[min(len(durations) - 1, len(durations) * point // 100)] * 1000)
+                    for point in points)
+
+    def histogram(self, name):
+        """Returns [(bucket upper bound in ms, count)] over the recent spans
+        called name. The last bucket, None, counts everything slower.
+
+        """
+        counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        with self._lock:
+            durations = list(self.durations.get(name, ()))
+        for duration in durations:
+            milliseconds = duration * 1000
+            index = 0
+            while index < len(HISTOGRAM_BUCKETS) and milliseconds > HISTOGRAM_BUCKETS[index]:
+                index += 1
+            counts[index] += 1
+        return list(zip(HISTOGRAM_BUCKETS + (None,), counts))
+
+    def summary(self):
+        """Returns a line per span name with its count and percentiles."""
+        lines = []
+        for name in sorted(self.durations):
+            values = self.percentiles(name)
+            lines.append("%-20s n=%-5d p50 %.1fms p90 %.1fms p99 %.1fms" % (
+                name, len(self.durations[name]), values[50], values[90], values[99]))
+        return lines
+
+    def export_chrome_trace(self, path=None):
+        """Writes the recorded spans as a Chrome trace JSON file and returns
+        its path.
+
+        """
+        if path is None:
+            if not os.path.isdir(TRACE_DIR):
+                os.makedirs(TRACE_DIR)
+            path = os.path.join(TRACE_DIR, "trace-%s.json" % time.strftime("%Y%m%d-%H%M%S"))
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        _log.info("Exported %d spans to %s", len(events), path)
+        return path
+
+
+tracer = Tracer()
@@ -0,0 +1,106 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from dragonfly import DictList, get_engine
+
+_log = logging.getLogger("grammer.vocabulary")
+
+
+def spoken_key(words):
+    """Returns the form a list of spoken words is recalled by.
+
+    Example:
+    ["My", "new", "variable."] => "my new variable".
+
+    """
+    return " ".join(re.sub(r'[^0-9a-z]', '', word.lower()) for word in words).strip()
+
+
+class RecentIdentifiers(object):
+    """The most recently formatted identifiers as a dragonfly DictList,
+    from the spoken words to the identifier, e.g. "my new variable" to
+    "myNewVariable".
+
+    The list is changed in place, so Dragon learns new identifiers without
+    the grammar being reloaded. Changes are collected and applied together
+    once no identifier has been added for debounceTime seconds, and only
+    the maxSize most recently used identifiers are kept.
+
+    Example:
+    "recall <identifier>": Text("%(identifier)s")
+
+    """
+
+    def __init__(self, name="recentIdentifiers", maxSize=200, debounceTime=1.0):
+        self.list = DictList(name)
+        self.maxSize = maxSize
+        self.debounceTime = debounceTime
+        self._entries = OrderedDict()
+        self._changed = False
+        self._timer = None
+        self._due = 0
+        self._lock = threading.Lock()
+
+    def remember(self, words, identifier):
+        """Adds an identifier under the words it was dictated as, or marks it
+        as recently used, and schedules the list update.
+
+        """
+        key = spoken_key(words)
+        if not key or not identifier:
+            return
+        with self._lock:
+            if self._entries.get(key) == identifier:
+                self._entries[key] = self._entries.pop(key)  # Most recent last.
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = identifier
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+            self._changed = True
+        self._schedule()
+
+    def flush(self):
+        """Applies the collected changes to the list in one update."""
+        with self._lock:
+            if not self._changed:
+                return
+            entries = dict(self._entries)
+            self._changed = False
+        with self.list:  # Batch mode, the engine is updated once on exit.
+            for key in [key for key in self.list if key not in entries]:
+                del self.list[key]
+            for key, identifier in entries.items():
+                if self.list.get(key) != identifier:
+                    self.list[key] = identifier
+        _log.debug("Updated %s to %d identifiers", self.list.name, len(entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._changed = True
+        self.flush()
+
+    def _schedule(self):
+        # Engine timers run on the engine's own thread, which is the only
+        # one allowed to update the grammar. Stopping a timer can block, so
+        # a pending timer is left running and its deadline moved instead.
+        with self._lock:
+            self._due = time.time() + self.debounceTime
+            if self._timer is None:
+                self._timer = get_engine().create_timer(self._expire, self.debounceTime, repeating=False)
+
+    def _expire(self):
+        with self._lock:
+            remaining = self._due - time.time()
+            if remaining > 0:
+                self._timer = get_engine().create_timer(self._expire, remaining, repeating=False)
+                return
+            self._timer = None
+        self.flush()
+
+
+recentIdentifiers = RecentIdentifiers()
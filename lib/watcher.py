@@ -0,0 +1,51 @@
+import logging
+import os
+
+from dragonfly import get_engine
+
+_log = logging.getLogger("grammer.watcher")
+
+
+class FileWatcher(object):
+    """Polls a file and calls callback() when it is created, changed or
+    removed.
+
+    Polling uses an engine timer, so the callback runs on the engine's
+    thread and may load and unload grammars.
+
+    """
+
+    def __init__(self, path, callback, interval=1.0):
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self._mtime = self._read_mtime()
+        self._timer = None
+
+    def start(self):
+        if self._timer is None:
+            self._timer = get_engine().create_timer(self.check, self.interval)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    def check(self):
+        """Calls the callback if the file changed since the last check."""
+        mtime = self._read_mtime()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        _log.info("%s changed", self.path)
+        try:
+            self.callback()
+        except Exception:
+            _log.exception("Failed to reload %s", self.path)
+        return True
+
+    def _read_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None